@@ -1,10 +1,224 @@
 import os
 import sys
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+import bisect
 import threading
+import queue
 from datetime import datetime
-import shutil
+
+from kiz_engine import (DEFAULT_CHUNK_SIZE, PADDING_STRATEGIES, MODES, DURABILITY, PADDING_CHECKS,
+                        DEFAULT_NAME_TEMPLATE, FileRegistry, FolderScanner,
+                        ExpansionOptions, Expander, BatchControl, Cancelled, RunReport, describe_result,
+                        format_duration, format_name, format_size, parse_fill, parse_size, plan_batch,
+                        write_manifest, SizeManifest, restore_sizes, UNDO_DIR, PRIORITIES, set_priority)
+import kiz_engine
+
+# tkinter se importa al abrir la interfaz (ver load_tkinter), así la línea
+# de comandos arranca sin cargarlo
+tk = ttk = filedialog = messagebox = scrolledtext = None
+
+# Tamaños de bloque de escritura que ofrece la interfaz
+CHUNK_SIZES = {
+    "64 KB": 64 * 1024,
+    "256 KB": 256 * 1024,
+    "1 MB": 1024 * 1024,
+    "4 MB": 4 * 1024 * 1024,
+    "16 MB": 16 * 1024 * 1024
+}
+
+# Rellenos que ofrece la interfaz; también se puede escribir cualquier patrón hexadecimal
+FILL_CHOICES = ["00", "FF", "20", "aleatorio", "aleatorio:1"]
+
+# Cola de eventos de la interfaz: cada cuánto se vacía, cuántos eventos se
+# atienden por vuelta y cuántas líneas del registro se conservan en pantalla
+UI_FLUSH_MS = 100
+UI_MAX_EVENTS = 2000
+LOG_MAX_LINES = 5000
+
+
+def load_tkinter():
+    """Importa tkinter bajo demanda."""
+    global tk, ttk, filedialog, messagebox, scrolledtext
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext
+
+
+class VirtualFileList:
+    """Lista de archivos que solo dibuja las filas visibles.
+    
+    Las filas se generan desde el registro al desplazarse, de modo que la
+    lista admite cientos de miles de entradas sin insertarlas en el Listbox.
+    """
+    
+    SORT_OPTIONS = ["Llegada", "Nombre", "Tamaño ↑", "Tamaño ↓"]
+    
+    def __init__(self, parent, registry, colors, format_size, rows=10):
+        self.registry = registry
+        self.colors = colors
+        self.format_size = format_size
+        self.rows = rows
+        self.view = []     # entradas filtradas y ordenadas
+        self.top = 0       # índice de la primera fila visible
+        self.states = {}   # ruta -> 'done' | 'error'
+        self.sort_by = "Llegada"
+        self.filter_text = ""
+        self._view_key = None
+        self._sort_keys = []  # clave de orden de cada entrada de la vista
+        
+        self.listbox = tk.Listbox(parent,
+                                  bg=colors['secondary'],
+                                  fg=colors['fg'],
+                                  selectbackground=colors['accent'],
+                                  selectforeground=colors['fg'],
+                                  font=('Consolas', 9),
+                                  relief='flat',
+                                  height=rows)
+        
+        self.scrollbar = ttk.Scrollbar(parent, command=self._on_scrollbar)
+        
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # El desplazamiento lo gestiona la vista, no el Listbox
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll(3))
+        self.listbox.bind('<Prior>', lambda e: self.scroll(-self.rows))
+        self.listbox.bind('<Next>', lambda e: self.scroll(self.rows))
+    
+    def refresh(self, sort_by=None, filter_text=None):
+        """Recalcula la vista si cambió el registro, el orden o el filtro, y la dibuja."""
+        if sort_by is not None:
+            self.sort_by = sort_by
+        if filter_text is not None:
+            self.filter_text = filter_text.strip().lower()
+        
+        view_key = (self.registry.version, self.sort_by, self.filter_text)
+        if view_key != self._view_key:
+            self._view_key = view_key
+            view = self._matching(self.registry.entries())
+            
+            sort_key = self._sort_key()
+            if sort_key:
+                view.sort(key=sort_key)
+                self._sort_keys = [sort_key(entry) for entry in view]
+            else:
+                self._sort_keys = []
+            
+            self.view = view
+        
+        self.render()
+    
+    def add(self, paths):
+        """Incorpora a la vista archivos recién agregados al registro y la dibuja.
+        
+        Solo se filtra y ordena el lote nuevo, que se mezcla con la vista ya
+        ordenada; así el escaneo no rehace la lista completa en cada sondeo.
+        """
+        # Si el registro cambió por otra vía desde la última vista, se rehace entera
+        if self._view_key != (self.registry.version - len(paths), self.sort_by, self.filter_text):
+            self.refresh()
+            return
+        self._view_key = (self.registry.version, self.sort_by, self.filter_text)
+        
+        batch = self._matching(self.registry.get(path) for path in paths)
+        sort_key = self._sort_key()
+        if not sort_key:
+            self.view.extend(batch)
+        elif batch:
+            batch.sort(key=sort_key)
+            view, keys = [], []
+            start = 0
+            for entry in batch:
+                key = sort_key(entry)
+                # bisect_right: a igual clave, lo nuevo va después, como en el orden estable
+                end = bisect.bisect_right(self._sort_keys, key, start)
+                view.extend(self.view[start:end])
+                keys.extend(self._sort_keys[start:end])
+                view.append(entry)
+                keys.append(key)
+                start = end
+            view.extend(self.view[start:])
+            keys.extend(self._sort_keys[start:])
+            self.view = view
+            self._sort_keys = keys
+        
+        self.render()
+    
+    def _matching(self, entries):
+        """Devuelve en una lista las entradas que pasan el filtro de nombre."""
+        if not self.filter_text:
+            return [entry for entry in entries if entry is not None]
+        needle = self.filter_text
+        return [entry for entry in entries
+                if entry is not None and needle in os.path.basename(entry.path).lower()]
+    
+    def _sort_key(self):
+        """Devuelve la clave ascendente del orden elegido, o None para el de llegada."""
+        if self.sort_by == "Nombre":
+            return lambda entry: os.path.basename(entry.path).lower()
+        if self.sort_by == "Tamaño ↑":
+            return lambda entry: entry.size
+        if self.sort_by == "Tamaño ↓":
+            return lambda entry: -entry.size
+        return None
+    
+    def clear(self):
+        """Vacía la vista y los estados."""
+        self.states.clear()
+        self.top = 0
+        self.refresh()
+    
+    def render(self):
+        """Dibuja solo las filas de la ventana visible."""
+        total = len(self.view)
+        self.top = max(0, min(self.top, total - self.rows))
+        
+        self.listbox.delete(0, tk.END)
+        for row, entry in enumerate(self.view[self.top:self.top + self.rows]):
+            self.listbox.insert(tk.END, self._row_text(self.top + row, entry))
+            self.listbox.itemconfig(row, fg=self._row_color(entry))
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def set_states(self, states):
+        """Marca de una vez varios archivos {ruta: 'done' | 'error' | None} y redibuja las filas visibles."""
+        self.states.update(states)
+        self.render()
+    
+    def scroll(self, rows):
+        """Desplaza la ventana visible `rows` filas."""
+        self.top += rows
+        self.render()
+        return "break"
+    
+    def _row_text(self, index, entry):
+        marker = {'done': "✓", 'error': "✗"}.get(self.states.get(entry.path), " ")
+        filename = os.path.basename(entry.path)
+        return f"{marker} {index+1:6d}. {filename} ({self.format_size(entry.size)})"
+    
+    def _row_color(self, entry):
+        state = self.states.get(entry.path)
+        if state == 'done':
+            return self.colors['success']
+        if state == 'error':
+            return self.colors['error']
+        return self.colors['fg']
+    
+    def _on_scrollbar(self, action, value, what=None):
+        if action == 'moveto':
+            self.top = int(float(value) * len(self.view))
+            self.render()
+        elif what == 'pages':
+            self.scroll(int(value) * self.rows)
+        else:
+            self.scroll(int(value))
+    
+    def _on_mousewheel(self, event):
+        return self.scroll(int(-1*(event.delta/120)) * 3)
+
 
 class FileExpanderApp:
     def __init__(self, root):
@@ -16,8 +230,18 @@ class FileExpanderApp:
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
         # Variables
-        self.file_paths = []
+        self.file_paths = FileRegistry()
         self.processing = False
+        self.scanner = None
+        self.pending_files = None
+        self.control = None
+        self.worker = None
+        
+        # Los hilos de trabajo no tocan Tk: dejan sus eventos en esta cola
+        self.ui_events = queue.Queue()
+        self.pending_status = None
+        self.log_file = None
+        self.last_report = None
         self.output_folder = tk.StringVar()
         self.output_folder.set(os.path.expanduser("~\\Desktop"))  # Por defecto en Escritorio
         
@@ -32,6 +256,9 @@ class FileExpanderApp:
         
         # Interfaz
         self.setup_ui()
+        
+        # Vaciar la cola de eventos periódicamente
+        self.root.after(UI_FLUSH_MS, self.drain_ui_events)
     
     def load_icon(self):
         """Intenta cargar el icono de la aplicación."""
@@ -182,27 +409,50 @@ class FileExpanderApp:
                                   padx=15,
                                   pady=5,
                                   cursor="hand2")
-        add_folder_btn.pack(side=tk.LEFT)
+        add_folder_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.cancel_scan_btn = tk.Button(btn_frame,
+                                        text="⏹ Cancelar escaneo",
+                                        command=self.cancel_scan,
+                                        bg=self.colors['accent'],
+                                        fg=self.colors['fg'],
+                                        font=('Segoe UI', 10),
+                                        relief='raised',
+                                        padx=15,
+                                        pady=5,
+                                        cursor="hand2",
+                                        state='disabled')
+        self.cancel_scan_btn.pack(side=tk.LEFT)
+        
+        # Orden y filtro de la lista
+        view_frame = tk.Frame(file_frame, bg=self.colors['secondary'])
+        view_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
+        
+        tk.Label(view_frame, text="Ordenar:",
+                bg=self.colors['secondary'], fg=self.colors['fg']).pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.sort_var = tk.StringVar(value="Llegada")
+        sort_combo = ttk.Combobox(view_frame,
+                                 textvariable=self.sort_var,
+                                 values=VirtualFileList.SORT_OPTIONS,
+                                 state="readonly",
+                                 width=10)
+        sort_combo.pack(side=tk.LEFT, padx=(0, 15))
         
-        # Lista de archivos
-        list_frame = tk.Frame(file_frame, bg=self.colors['secondary'])
-        list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
+        tk.Label(view_frame, text="Filtrar:",
+                bg=self.colors['secondary'], fg=self.colors['fg']).pack(side=tk.LEFT, padx=(0, 5))
         
-        self.file_listbox = tk.Listbox(list_frame,
-                                      bg=self.colors['secondary'],
-                                      fg=self.colors['fg'],
-                                      selectbackground=self.colors['accent'],
-                                      selectforeground=self.colors['fg'],
-                                      font=('Consolas', 9),
-                                      relief='flat',
-                                      height=6)
+        self.filter_entry = ttk.Entry(view_frame, width=30)
+        self.filter_entry.pack(side=tk.LEFT)
         
-        scrollbar = ttk.Scrollbar(list_frame)
-        self.file_listbox.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=self.file_listbox.yview)
+        sort_combo.bind('<<ComboboxSelected>>', self.update_file_view)
+        self.filter_entry.bind('<KeyRelease>', self.update_file_view)
         
-        self.file_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Lista de archivos (virtual: solo se dibujan las filas visibles)
+        list_frame = tk.Frame(file_frame, bg=self.colors['secondary'])
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
+        
+        self.file_list = VirtualFileList(list_frame, self.file_paths, self.colors, self.format_size)
         
         # Info label debajo de la lista
         self.file_info_label = tk.Label(file_frame,
@@ -252,11 +502,140 @@ class FileExpanderApp:
         self.mode_var = tk.StringVar(value="Agregar")
         mode_combo = ttk.Combobox(controls_frame,
                                  textvariable=self.mode_var,
-                                 values=["Agregar", "Establecer tamaño"],
+                                 values=MODES,
                                  state="readonly",
-                                 width=15)
+                                 width=22)
         mode_combo.grid(row=0, column=4)
         
+        # Tamaño de bloque para escribir el relleno
+        tk.Label(controls_frame, text="Bloque de escritura:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=1, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.chunk_var = tk.StringVar(value="1 MB")
+        chunk_combo = ttk.Combobox(controls_frame,
+                                  textvariable=self.chunk_var,
+                                  values=list(CHUNK_SIZES),
+                                  state="readonly",
+                                  width=8)
+        chunk_combo.grid(row=1, column=1, pady=(10, 0), sticky='w')
+        
+        # Estrategia de relleno
+        tk.Label(controls_frame, text="Estrategia:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=1, column=3, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.strategy_var = tk.StringVar(value="Escribir")
+        strategy_combo = ttk.Combobox(controls_frame,
+                                     textvariable=self.strategy_var,
+                                     values=PADDING_STRATEGIES,
+                                     state="readonly",
+                                     width=15)
+        strategy_combo.grid(row=1, column=4, pady=(10, 0))
+        
+        # Concurrencia
+        tk.Label(controls_frame, text="Hilos:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=2, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.workers_var = tk.IntVar(value=4)
+        ttk.Spinbox(controls_frame,
+                    textvariable=self.workers_var,
+                    from_=1,
+                    to=64,
+                    state="readonly",
+                    width=6).grid(row=2, column=1, pady=(10, 0), sticky='w')
+        
+        tk.Label(controls_frame, text="Hilos por disco:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=2, column=3, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.per_device_var = tk.IntVar(value=2)
+        ttk.Spinbox(controls_frame,
+                    textvariable=self.per_device_var,
+                    from_=1,
+                    to=64,
+                    state="readonly",
+                    width=6).grid(row=2, column=4, pady=(10, 0), sticky='w')
+        
+        # Durabilidad de lo escrito
+        tk.Label(controls_frame, text="Durabilidad:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=3, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.durability_var = tk.StringVar(value="Ninguna")
+        ttk.Combobox(controls_frame,
+                     textvariable=self.durability_var,
+                     values=DURABILITY,
+                     state="readonly",
+                     width=12).grid(row=3, column=1, columnspan=2, pady=(10, 0), sticky='w')
+        
+        # Ceros que el archivo ya tiene al final (solo en modo Agregar)
+        tk.Label(controls_frame, text="Relleno previo:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=3, column=3, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.padding_check_var = tk.StringVar(value="Ignorar")
+        ttk.Combobox(controls_frame,
+                     textvariable=self.padding_check_var,
+                     values=PADDING_CHECKS,
+                     state="readonly",
+                     width=15).grid(row=3, column=4, pady=(10, 0))
+        
+        # Patrón de relleno: se puede elegir o escribir cualquier byte en hexadecimal
+        tk.Label(controls_frame, text="Relleno:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=4, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.fill_var = tk.StringVar(value="00")
+        ttk.Combobox(controls_frame,
+                     textvariable=self.fill_var,
+                     values=FILL_CHOICES,
+                     width=12).grid(row=4, column=1, columnspan=2, pady=(10, 0), sticky='w')
+        
+        # Prioridad frente a otros procesos de la máquina
+        tk.Label(controls_frame, text="Prioridad:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=4, column=3, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.priority_var = tk.StringVar(value="Normal")
+        ttk.Combobox(controls_frame,
+                     textvariable=self.priority_var,
+                     values=list(PRIORITIES),
+                     state="readonly",
+                     width=15).grid(row=4, column=4, pady=(10, 0))
+        
+        # Límites de ritmo (0 = sin límite), modificables durante el procesamiento
+        tk.Label(controls_frame, text="Límite MB/s:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=5, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.limit_rate_var = tk.StringVar(value="0")
+        ttk.Entry(controls_frame,
+                  textvariable=self.limit_rate_var,
+                  width=8,
+                  font=('Segoe UI', 10)).grid(row=5, column=1, pady=(10, 0), sticky='w')
+        
+        tk.Label(controls_frame, text="Archivos/s:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=5, column=3, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.limit_files_var = tk.StringVar(value="0")
+        ttk.Entry(controls_frame,
+                  textvariable=self.limit_files_var,
+                  width=8,
+                  font=('Segoe UI', 10)).grid(row=5, column=4, pady=(10, 0), sticky='w')
+        
+        tk.Button(controls_frame,
+                  text="🚦 Aplicar límites",
+                  command=self.apply_limits,
+                  bg=self.colors['accent'],
+                  fg=self.colors['fg'],
+                  font=('Segoe UI', 9),
+                  relief='raised',
+                  padx=10,
+                  cursor="hand2").grid(row=6, column=0, columnspan=2, pady=(10, 0), sticky='w')
+        
+        self.drop_cache_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(controls_frame,
+                       text="No llenar la caché del sistema",
+                       variable=self.drop_cache_var,
+                       bg=self.colors['bg'],
+                       fg=self.colors['fg'],
+                       selectcolor=self.colors['bg'],
+                       activebackground=self.colors['bg'],
+                       activeforeground=self.colors['fg']).grid(row=6, column=3, columnspan=2, pady=(10, 0), sticky='w')
+        
         # Info label
         self.size_info_label = tk.Label(size_frame,
                                        text="",
@@ -336,6 +715,40 @@ class FileExpanderApp:
                                   activeforeground=self.colors['fg'])
         prefix_cb.grid(row=2, column=0, columnspan=3, sticky='w', pady=(10, 0))
         
+        # Checkbox para el diario de lotes
+        self.journal_var = tk.BooleanVar(value=True)
+        journal_cb = tk.Checkbutton(controls_frame,
+                                   text="Reanudar lotes interrumpidos (diario en disco)",
+                                   variable=self.journal_var,
+                                   bg=self.colors['bg'],
+                                   fg=self.colors['fg'],
+                                   selectcolor=self.colors['bg'],
+                                   activebackground=self.colors['bg'],
+                                   activeforeground=self.colors['fg'])
+        journal_cb.grid(row=3, column=0, columnspan=3, sticky='w', pady=(5, 0))
+        
+        # Plantilla de nombre para varios tamaños ("1, 16, 64" en el tamaño)
+        tk.Label(controls_frame, text="Nombre con varios tamaños:",
+                bg=self.colors['bg'], fg=self.colors['fg']).grid(row=4, column=0, padx=(0, 10), pady=(10, 0), sticky='w')
+        
+        self.name_template_var = tk.StringVar(value=DEFAULT_NAME_TEMPLATE)
+        ttk.Entry(controls_frame,
+                  textvariable=self.name_template_var,
+                  width=40,
+                  font=('Segoe UI', 10)).grid(row=4, column=1, padx=(0, 10), pady=(10, 0))
+        
+        # Checkbox para el manifiesto SHA-256
+        self.manifest_var = tk.BooleanVar(value=False)
+        manifest_cb = tk.Checkbutton(controls_frame,
+                                    text="Generar manifiesto SHA-256 de las salidas",
+                                    variable=self.manifest_var,
+                                    bg=self.colors['bg'],
+                                    fg=self.colors['fg'],
+                                    selectcolor=self.colors['bg'],
+                                    activebackground=self.colors['bg'],
+                                    activeforeground=self.colors['fg'])
+        manifest_cb.grid(row=5, column=0, columnspan=3, sticky='w', pady=(5, 0))
+        
         # Info label
         self.output_info_label = tk.Label(output_frame,
                                          text="Por defecto, los archivos se guardan en la misma ubicación original",
@@ -362,6 +775,19 @@ class FileExpanderApp:
                              cursor="hand2")
         clear_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # Botón simular
+        simulate_btn = tk.Button(button_frame,
+                                text="🧪 Simular",
+                                command=self.simulate_files,
+                                bg=self.colors['accent'],
+                                fg=self.colors['fg'],
+                                font=('Segoe UI', 10),
+                                relief='raised',
+                                padx=15,
+                                pady=5,
+                                cursor="hand2")
+        simulate_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         # Botón procesar
         self.process_btn = tk.Button(button_frame,
                                     text="⚡ PROCESAR ARCHIVOS",
@@ -375,6 +801,59 @@ class FileExpanderApp:
                                     cursor="hand2")
         self.process_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # Botones pausar y cancelar, activos solo durante el procesamiento
+        self.pause_btn = tk.Button(button_frame,
+                                  text="⏸ Pausar",
+                                  command=self.toggle_pause,
+                                  state='disabled',
+                                  bg=self.colors['accent'],
+                                  fg=self.colors['fg'],
+                                  font=('Segoe UI', 10),
+                                  relief='raised',
+                                  padx=15,
+                                  pady=5,
+                                  cursor="hand2")
+        self.pause_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.cancel_btn = tk.Button(button_frame,
+                                   text="⏹ Cancelar",
+                                   command=self.cancel_processing,
+                                   state='disabled',
+                                   bg=self.colors['accent'],
+                                   fg=self.colors['fg'],
+                                   font=('Segoe UI', 10),
+                                   relief='raised',
+                                   padx=15,
+                                   pady=5,
+                                   cursor="hand2")
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Botón exportar informe
+        report_btn = tk.Button(button_frame,
+                              text="📊 Exportar informe",
+                              command=self.export_report,
+                              bg=self.colors['accent'],
+                              fg=self.colors['fg'],
+                              font=('Segoe UI', 10),
+                              relief='raised',
+                              padx=15,
+                              pady=5,
+                              cursor="hand2")
+        report_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Botón deshacer, devuelve los originales de un lote a su tamaño
+        undo_btn = tk.Button(button_frame,
+                            text="↩ Deshacer lote",
+                            command=self.undo_batch,
+                            bg=self.colors['accent'],
+                            fg=self.colors['fg'],
+                            font=('Segoe UI', 10),
+                            relief='raised',
+                            padx=15,
+                            pady=5,
+                            cursor="hand2")
+        undo_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         # Botón salir
         exit_btn = tk.Button(button_frame,
                             text="❌ Salir",
@@ -413,6 +892,18 @@ class FileExpanderApp:
         self.log_text.tag_config('warning', foreground=self.colors['warning'])
         self.log_text.tag_config('info', foreground=self.colors['accent_light'])
         self.log_text.tag_config('header', font=('Consolas', 10, 'bold'))
+        
+        # Registro completo en disco (en pantalla solo quedan las últimas líneas)
+        self.log_file_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(log_frame,
+                      text="Guardar registro completo en archivo",
+                      variable=self.log_file_var,
+                      bg=self.colors['bg'],
+                      fg=self.colors['fg'],
+                      selectcolor=self.colors['bg'],
+                      activebackground=self.colors['bg'],
+                      activeforeground=self.colors['fg'],
+                      command=self.toggle_log_file).pack(anchor=tk.W, pady=(5, 0))
     
     def setup_status_bar(self):
         """Configura la barra de estado."""
@@ -470,8 +961,7 @@ class FileExpanderApp:
         """Agrega archivos a la lista."""
         added_count = 0
         for file_path in files:
-            if os.path.isfile(file_path) and file_path not in self.file_paths:
-                self.file_paths.append(file_path)
+            if self.file_paths.add(file_path):
                 added_count += 1
         
         if added_count > 0:
@@ -482,53 +972,102 @@ class FileExpanderApp:
             self.log_message("⚠️ No se agregaron archivos nuevos", 'warning')
     
     def add_folder(self, folder):
-        """Agrega todos los archivos de una carpeta."""
+        """Agrega todos los archivos de una carpeta escaneándola en segundo plano."""
         if not os.path.isdir(folder):
             self.log_message(f"✗ La carpeta no existe: {folder}", 'error')
             return
         
-        added_count = 0
-        for root, dirs, files in os.walk(folder):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if file_path not in self.file_paths:
-                    self.file_paths.append(file_path)
-                    added_count += 1
+        if self.scanner:
+            messagebox.showwarning("Escaneando", "Espera a que termine el escaneo actual")
+            return
         
-        if added_count > 0:
-            self.update_file_list()
-            self.update_size_info()
-            self.log_message(f"✓ Se agregaron {added_count} archivos desde la carpeta", 'success')
-        else:
-            self.log_message(f"⚠️ No se encontraron archivos en: {folder}", 'warning')
+        self.scanner = FolderScanner(folder)
+        self.scan_added = 0
+        self.cancel_scan_btn.config(state='normal')
+        self.log_message(f"🔍 Escaneando carpeta: {folder}", 'info')
+        self.scanner.start()
+        self.root.after(100, self.poll_scan)
     
-    def update_file_list(self):
-        """Actualiza la lista de archivos en la interfaz."""
-        self.file_listbox.delete(0, tk.END)
+    def poll_scan(self):
+        """Incorpora los lotes encontrados por el escáner y muestra el avance."""
+        scanner = self.scanner
+        if scanner is None:
+            return
         
-        for i, path in enumerate(self.file_paths[:50]):  # Mostrar máximo 50
-            filename = os.path.basename(path)
+        finished = False
+        added = []
+        while True:
             try:
-                size = os.path.getsize(path)
-                display_text = f"{i+1:3d}. {filename} ({self.format_size(size)})"
-            except:
-                display_text = f"{i+1:3d}. {filename} (Error al obtener tamaño)"
-            self.file_listbox.insert(tk.END, display_text)
+                batch = scanner.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                finished = True
+                break
+            for file_path, st in batch:
+                if self.file_paths.add(file_path, st):
+                    added.append(file_path)
+        
+        if added:
+            self.scan_added += len(added)
+            # Si ya se está procesando, los nuevos archivos se encolan para el hilo de trabajo
+            if self.pending_files is not None:
+                self.pending_files.put(added)
+            self.update_file_list(added)
+            self.update_size_info()
         
-        total_count = len(self.file_paths)
-        if total_count > 50:
-            self.file_listbox.insert(tk.END, f"... y {total_count - 50} archivos más")
+        if not finished:
+            if not self.processing:
+                self.status_var.set(f"🔍 Escaneando... {scanner.files_found} archivos "
+                                    f"({self.format_size(scanner.bytes_found)})")
+            self.root.after(100, self.poll_scan)
+            return
+        
+        self.scanner = None
+        self.cancel_scan_btn.config(state='disabled')
+        if self.pending_files is not None:
+            self.pending_files.put(None)
+            self.pending_files = None
+        
+        if scanner.cancelled:
+            self.log_message(f"⏹ Escaneo cancelado. Se agregaron {self.scan_added} archivos", 'warning')
+        elif self.scan_added > 0:
+            self.log_message(f"✓ Se agregaron {self.scan_added} archivos desde la carpeta", 'success')
+        else:
+            self.log_message(f"⚠️ No se encontraron archivos en: {scanner.folder}", 'warning')
+        
+        if scanner.errors:
+            self.log_message(f"⚠️ No se pudieron leer {scanner.errors} entradas", 'warning')
+    
+    def cancel_scan(self):
+        """Cancela el escaneo de carpeta en curso."""
+        if self.scanner:
+            self.scanner.cancel()
+    
+    def update_file_list(self, added=None):
+        """Actualiza la lista de archivos en la interfaz.
+        
+        `added` son las rutas recién agregadas al registro, que se mezclan en la
+        vista sin reordenarla entera.
+        """
+        if added:
+            self.file_list.add(added)
+        else:
+            self.file_list.refresh()
         
         # Actualizar info label
-        try:
-            total_size = sum(os.path.getsize(p) for p in self.file_paths if os.path.exists(p))
-            self.file_info_label.config(
-                text=f"📁 Total: {total_count} archivos | 📊 Tamaño total: {self.format_size(total_size)}"
-            )
-        except:
-            self.file_info_label.config(text=f"📁 Total: {total_count} archivos")
+        total_count = len(self.file_paths)
+        self.file_info_label.config(
+            text=f"📁 Total: {total_count} archivos | 📊 Tamaño total: {self.format_size(self.file_paths.total_size)}"
+        )
         
-        self.status_var.set(f"📊 {total_count} archivos listos para procesar")
+        if not self.processing:
+            self.status_var.set(f"📊 {total_count} archivos listos para procesar")
+    
+    def update_file_view(self, event=None):
+        """Aplica el orden y el filtro elegidos a la lista de archivos."""
+        self.file_list.top = 0
+        self.file_list.refresh(self.sort_var.get(), self.filter_entry.get())
     
     def clear_files(self):
         """Limpia la lista de archivos."""
@@ -536,8 +1075,13 @@ class FileExpanderApp:
             messagebox.showwarning("Procesando", "Espera a que termine el procesamiento actual")
             return
         
+        if self.scanner:
+            self.scanner.cancel()
+            self.scanner = None
+            self.cancel_scan_btn.config(state='disabled')
+        
         self.file_paths.clear()
-        self.file_listbox.delete(0, tk.END)
+        self.file_list.clear()
         self.file_info_label.config(text="")
         self.status_var.set("📊 Listo. Agrega archivos para comenzar")
         self.log_message("🗑️ Lista de archivos limpiada", 'info')
@@ -549,31 +1093,30 @@ class FileExpanderApp:
             return
         
         try:
-            size_value = float(self.size_entry.get())
-            unit = self.unit_var.get()
+            sizes = self.read_sizes()
+            add_bytes = sizes[0]
             mode = self.mode_var.get()
             
-            # Convertir a bytes
-            if unit == "KB":
-                add_bytes = int(size_value * 1024)
-            elif unit == "MB":
-                add_bytes = int(size_value * 1024 * 1024)
-            else:
-                add_bytes = int(size_value)
-            
-            if mode == "Agregar":
+            if len(sizes) > 1:
+                info_text = f"📦 {len(sizes)} salidas por archivo: "
+                info_text += ", ".join(self.format_size(size) for size in sizes)
+            elif mode == "Alinear a múltiplo":
+                # Crecimiento total desde la caché del registro, sin tocar el disco
+                info_text = f"📐 Cada archivo se redondeará a un múltiplo de {self.format_size(add_bytes)} "
+                info_text += f"(Total: +{self.format_size(self.file_paths.aligned_growth(add_bytes))})"
+            elif mode == "Siguiente potencia de 2":
+                info_text = "📐 Cada archivo crecerá hasta la siguiente potencia de 2 "
+                info_text += f"(Total: +{self.format_size(self.file_paths.power_of_two_growth())})"
+            elif mode == "Agregar":
                 total_added = add_bytes * len(self.file_paths)
                 info_text = f"📈 Se agregarán {self.format_size(add_bytes)} a cada archivo "
                 info_text += f"(Total: {self.format_size(total_added)})"
             else:
-                # Calcular cuánto se agregaría a cada archivo
-                try:
-                    current_total = sum(os.path.getsize(p) for p in self.file_paths)
-                    avg_current = current_total / len(self.file_paths) if self.file_paths else 0
-                    info_text = f"📏 Tamaño actual promedio: {self.format_size(avg_current)} "
-                    info_text += f"| Nuevo tamaño: {self.format_size(add_bytes)}"
-                except:
-                    info_text = "⚠️ Error al calcular tamaños"
+                # Tamaños actuales desde la caché del registro
+                info_text = f"📏 Tamaño actual promedio: {self.format_size(self.file_paths.avg_size)} "
+                info_text += f"(mín. {self.format_size(self.file_paths.min_size)}, "
+                info_text += f"máx. {self.format_size(self.file_paths.max_size)}) "
+                info_text += f"| Nuevo tamaño: {self.format_size(add_bytes)}"
             
             self.size_info_label.config(text=info_text)
             
@@ -584,27 +1127,227 @@ class FileExpanderApp:
     
     def format_size(self, size_bytes):
         """Formatea bytes a unidades legibles."""
-        try:
-            size_bytes = float(size_bytes)
-            if size_bytes >= 1024 * 1024 * 1024:
-                return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
-            elif size_bytes >= 1024 * 1024:
-                return f"{size_bytes / (1024 * 1024):.2f} MB"
-            elif size_bytes >= 1024:
-                return f"{size_bytes / 1024:.2f} KB"
-            else:
-                return f"{size_bytes:.0f} bytes"
-        except:
-            return "0 bytes"
+        return format_size(size_bytes)
     
     def log_message(self, message, tag=''):
-        """Agrega un mensaje al log."""
+        """Agrega un mensaje al log (se puede llamar desde cualquier hilo)."""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
+        self.ui_events.put(('log', f"[{timestamp}] {message}\n", tag))
+    
+    def post_ui(self, func, *args):
+        """Pide que `func(*args)` se ejecute en el hilo de la interfaz."""
+        self.ui_events.put(('call', func, args))
+    
+    def post_file_state(self, path, state):
+        """Pide marcar la fila de un archivo; los estados de cada vuelta se aplican juntos."""
+        self.ui_events.put(('state', path, state))
+    
+    def set_status(self, text):
+        """Actualiza la barra de estado; solo se muestra el último valor de cada vuelta."""
+        self.pending_status = text
+    
+    def drain_ui_events(self):
+        """Atiende por lotes los eventos pendientes de la interfaz."""
+        self.root.after(UI_FLUSH_MS, self.drain_ui_events)
         
-        self.log_text.insert(tk.END, log_entry, tag)
+        status, self.pending_status = self.pending_status, None
+        if status is not None:
+            self.status_var.set(status)
+        
+        log_chunks = []
+        states = {}
+        for _ in range(UI_MAX_EVENTS):
+            try:
+                event = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            
+            if event[0] == 'log':
+                log_chunks.extend(event[1:])
+                continue
+            if event[0] == 'state':
+                states[event[1]] = event[2]
+                continue
+            
+            # Respetar el orden: volcar primero los mensajes y estados anteriores
+            if log_chunks:
+                self.write_log(log_chunks)
+                log_chunks = []
+            if states:
+                self.file_list.set_states(states)
+                states = {}
+            _, func, args = event
+            try:
+                func(*args)
+            except Exception as e:
+                log_chunks.extend((f"⚠️ Error en la interfaz: {e}\n", 'error'))
+        
+        if log_chunks:
+            self.write_log(log_chunks)
+        if states:
+            self.file_list.set_states(states)
+    
+    def write_log(self, chunks):
+        """Inserta de una vez pares (texto, tag) y recorta el log a LOG_MAX_LINES."""
+        self.log_text.insert(tk.END, *chunks)
+        
+        # El texto acaba en salto de línea: la última línea siempre está vacía
+        lines = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if lines > LOG_MAX_LINES:
+            self.log_text.delete('1.0', f"{lines - LOG_MAX_LINES + 1}.0")
         self.log_text.see(tk.END)
-        self.log_text.update_idletasks()
+        
+        if self.log_file:
+            try:
+                self.log_file.write(''.join(chunks[::2]))
+                self.log_file.flush()
+            except OSError as e:
+                self.log_file = None
+                self.log_file_var.set(False)
+                self.log_message(f"✗ No se pudo escribir el registro: {e}", 'error')
+    
+    def toggle_log_file(self):
+        """Abre o cierra el archivo con el registro completo."""
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+        
+        if not self.log_file_var.get():
+            return
+        
+        path = filedialog.asksaveasfilename(title="Guardar registro",
+                                            defaultextension=".log",
+                                            initialfile=f"kiz_{datetime.now():%Y%m%d_%H%M%S}.log",
+                                            filetypes=[("Registro", "*.log"), ("Todos", "*.*")])
+        if not path:
+            self.log_file_var.set(False)
+            return
+        
+        try:
+            self.log_file = open(path, 'a', encoding='utf-8')
+            self.log_message(f"📝 Guardando registro completo en: {path}", 'info')
+        except OSError as e:
+            self.log_file_var.set(False)
+            self.log_message(f"✗ No se pudo abrir el registro: {e}", 'error')
+    
+    def read_options(self):
+        """Lee la configuración de la interfaz; devuelve None si no es válida.
+        
+        Lanza ValueError si el tamaño no es un número válido.
+        """
+        sizes = self.read_sizes()
+        
+        # Con varios tamaños, cada uno necesita un nombre de salida distinto
+        name_template = self.name_template_var.get()
+        if len(sizes) > 1:
+            try:
+                names = {format_name(name_template, "archivo.bin", size, index) for index, size in enumerate(sizes)}
+            except ValueError:
+                messagebox.showerror("Error", f"Plantilla de nombre inválida: {name_template}")
+                return None
+            if len(names) < len(sizes):
+                messagebox.showerror("Error", "La plantilla de nombre debe distinguir cada tamaño, "
+                                              "p. ej. con {size} o {index}")
+                return None
+        
+        try:
+            parse_fill(self.fill_var.get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Relleno inválido: {e}")
+            return None
+        try:
+            bytes_per_second, files_per_second = self.read_limits()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Límite inválido: {e}")
+            return None
+        
+        # Verificar carpeta de salida si está habilitada
+        output_folder = None
+        if self.custom_output_var.get():
+            output_folder = self.output_folder.get()
+            if not output_folder or not os.path.isdir(output_folder):
+                messagebox.showerror("Error", "Por favor selecciona una carpeta de salida válida")
+                return None
+        
+        return ExpansionOptions(sizes[0],
+                                mode=self.mode_var.get(),
+                                output_folder=output_folder,
+                                use_prefix=self.use_prefix_var.get(),
+                                strategy=self.strategy_var.get(),
+                                chunk_size=CHUNK_SIZES.get(self.chunk_var.get(), DEFAULT_CHUNK_SIZE),
+                                workers=self.workers_var.get(),
+                                per_device=self.per_device_var.get(),
+                                journal=self.journal_var.get(),
+                                durability=self.durability_var.get(),
+                                padding_check=self.padding_check_var.get(),
+                                targets=sizes,
+                                name_template=name_template,
+                                fill=self.fill_var.get(),
+                                manifest=self.manifest_var.get(),
+                                max_bytes_per_second=bytes_per_second,
+                                max_files_per_second=files_per_second,
+                                drop_cache=self.drop_cache_var.get())
+    
+    def read_limits(self):
+        """Lee los límites de MB/s y archivos/s (0 = sin límite); lanza ValueError si no son válidos."""
+        megabytes = float(self.limit_rate_var.get().replace(",", ".") or 0)
+        files = float(self.limit_files_var.get().replace(",", ".") or 0)
+        if megabytes < 0 or files < 0:
+            raise ValueError("no puede ser negativo")
+        return int(megabytes * 1024 * 1024), files
+    
+    def apply_limits(self):
+        """Aplica los límites de ritmo al lote en curso sin detenerlo."""
+        try:
+            bytes_per_second, files_per_second = self.read_limits()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Límite inválido: {e}")
+            return
+        if not self.control:
+            self.log_message("🚦 Los límites se aplicarán al próximo lote", 'info')
+            return
+        self.control.limits.set(bytes_per_second, files_per_second)
+        self.log_message(f"🚦 Límite aplicado: {self.control.limits.describe()}", 'info')
+    
+    def read_sizes(self):
+        """Lee los tamaños del campo de tamaño ("100" o "1, 16, 64"); lanza ValueError si no son válidos."""
+        sizes = [parse_size(value, self.unit_var.get()) for value in self.size_entry.get().split(",")
+                 if value.strip()]
+        if not sizes:
+            raise ValueError("no se indicó ningún tamaño")
+        # Un tamaño 0 no tiene sentido en ningún modo y al alinear dividiría por cero
+        if min(sizes) <= 0:
+            raise ValueError("el tamaño debe ser mayor que 0")
+        return sizes
+    
+    def plan_files(self, options):
+        """Calcula el plan del lote y lo muestra en el registro; devuelve None si falla."""
+        try:
+            plan = plan_batch(options, self.file_paths.entries())
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo comprobar el espacio libre: {e}")
+            return None
+        
+        self.log_message("🧪 Plan del lote", 'header')
+        for line in plan.lines():
+            self.log_message(line, 'info')
+        if not plan.ok:
+            self.log_message("⚠️ No hay espacio libre suficiente para todo el lote", 'error')
+        return plan
+    
+    def simulate_files(self):
+        """Muestra lo que haría el lote sin escribir nada."""
+        if not self.file_paths:
+            messagebox.showwarning("Sin archivos", "No hay archivos para procesar")
+            return
+        
+        try:
+            options = self.read_options()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Tamaño inválido: {e}")
+            return
+        if options and self.plan_files(options):
+            self.status_var.set("🧪 Simulación completada: revisa el registro")
     
     def process_files(self):
         """Procesa los archivos seleccionados."""
@@ -618,32 +1361,37 @@ class FileExpanderApp:
         
         try:
             # Obtener configuración
-            size_value = float(self.size_entry.get())
-            unit = self.unit_var.get()
-            mode = self.mode_var.get()
-            
-            # Convertir a bytes
-            if unit == "KB":
-                add_bytes = int(size_value * 1024)
-            elif unit == "MB":
-                add_bytes = int(size_value * 1024 * 1024)
-            else:
-                add_bytes = int(size_value)
-            
-            if add_bytes <= 0:
-                messagebox.showerror("Error", "El tamaño debe ser mayor que 0")
+            options = self.read_options()
+            if options is None:
                 return
             
-            # Verificar carpeta de salida si está habilitada
-            if self.custom_output_var.get():
-                output_folder = self.output_folder.get()
-                if not output_folder or not os.path.isdir(output_folder):
-                    messagebox.showerror("Error", "Por favor selecciona una carpeta de salida válida")
-                    return
+            # Comprobar el espacio antes de empezar para no fallar a mitad del lote
+            plan = self.plan_files(options)
+            if plan is None:
+                return
+            if not plan.ok and not messagebox.askyesno(
+                    "Espacio insuficiente",
+                    "No hay espacio libre suficiente para todo el lote (ver el registro).\n"
+                    "¿Procesar de todos modos?"):
+                return
             
             # Confirmación
             confirm_msg = f"¿Procesar {len(self.file_paths)} archivos?\n"
-            confirm_msg += f"Se agregarán {self.format_size(add_bytes)} a cada archivo.\n\n"
+            if self.scanner:
+                confirm_msg += "🔍 El escaneo sigue en curso: los archivos nuevos se procesarán al llegar.\n"
+            if options.targets:
+                confirm_msg += f"Se generarán {len(options.targets)} salidas por archivo: " + \
+                               ", ".join(self.format_size(size) for size in options.targets) + "\n"
+            elif options.mode == "Agregar":
+                confirm_msg += f"Se agregarán {self.format_size(options.add_bytes)} a cada archivo.\n"
+            elif options.mode == "Alinear a múltiplo":
+                confirm_msg += f"Cada archivo se redondeará a un múltiplo de {self.format_size(options.add_bytes)}.\n"
+            elif options.mode == "Siguiente potencia de 2":
+                confirm_msg += "Cada archivo crecerá hasta la siguiente potencia de 2.\n"
+            else:
+                confirm_msg += f"Cada archivo tendrá al menos {self.format_size(options.add_bytes)}.\n"
+            confirm_msg += (f"Relleno total: {self.format_size(plan.pad_bytes)} | "
+                            f"Espacio necesario: {self.format_size(plan.needed)}\n\n")
             
             if self.custom_output_var.get():
                 confirm_msg += f"📁 Carpeta de salida: {self.output_folder.get()}\n"
@@ -660,121 +1408,173 @@ class FileExpanderApp:
             # Iniciar procesamiento en hilo separado
             self.processing = True
             self.process_btn.config(state='disabled', text="⏳ PROCESANDO...")
+            self.pause_btn.config(state='normal', text="⏸ Pausar")
+            self.cancel_btn.config(state='normal')
             self.status_var.set("⏳ Procesando archivos...")
             
-            thread = threading.Thread(target=self.process_files_thread, 
-                                     args=(add_bytes, mode),
-                                     daemon=True)
-            thread.start()
+            self.file_list.states.clear()
+            self.file_list.render()
+            
+            # Con un escaneo en curso, el hilo recibe los lotes nuevos por esta cola
+            self.pending_files = queue.Queue() if self.scanner else None
+            
+            self.control = BatchControl()
+            self.worker = threading.Thread(target=self.process_files_thread,
+                                          args=(list(self.file_paths), options, self.control,
+                                                self.pending_files, self.priority_var.get()),
+                                          daemon=True)
+            self.worker.start()
             
         except ValueError as e:
             messagebox.showerror("Error", f"Tamaño inválido: {e}")
         except Exception as e:
             messagebox.showerror("Error", f"Error inesperado: {str(e)}")
     
-    def process_files_thread(self, add_bytes, mode):
+    def process_files_thread(self, file_paths, options, control, pending_files=None, priority="Normal"):
         """Hilo para procesar archivos."""
-        success_count = 0
-        error_count = 0
-        
-        use_custom_output = self.custom_output_var.get()
-        output_folder = self.output_folder.get() if use_custom_output else None
-        use_prefix = self.use_prefix_var.get()
-        
-        self.log_message(f"🚀 Iniciando procesamiento de {len(self.file_paths)} archivos", 'header')
-        self.log_message(f"Modo: {mode} | Bytes por archivo: {add_bytes:,}", 'info')
-        if use_custom_output:
-            self.log_message(f"📁 Carpeta de salida: {output_folder}", 'info')
-            if use_prefix:
+        # La prioridad se aplica a este hilo y la heredan los hilos del lote, no la interfaz
+        applied = set_priority(priority)
+        try:
+            # Con un escaneo en curso aún no se conoce el conjunto completo de archivos
+            expander = Expander(options, control, None if pending_files else file_paths)
+        except OSError as e:
+            self.log_message(f"✗ No se pudo abrir el diario del lote: {e}", 'error')
+            self.post_ui(self.process_complete, 0, len(file_paths), file_paths)
+            return
+        
+        report = RunReport(len(file_paths))
+        self.last_report = report
+        
+        self.log_message(f"🚀 Iniciando procesamiento de {len(file_paths)} archivos", 'header')
+        self.log_message(f"Modo: {options.mode} | Bytes por archivo: "
+                         f"{', '.join(f'{size:,}' for size in options.amounts)} | "
+                         f"Estrategia: {options.strategy}", 'info')
+        self.log_message(f"🎨 Relleno: {expander.fill}", 'info')
+        self.log_message(f"🧵 Hilos: {options.workers} | Por disco: {options.per_device} | "
+                         f"Durabilidad: {options.durability}", 'info')
+        if control.limits.bytes.rate or control.limits.files.rate or applied:
+            self.log_message(f"🚦 Límite: {control.limits.describe()} | Prioridad: "
+                             f"{', '.join(applied) or 'normal'}", 'info')
+        if options.output_folder:
+            self.log_message(f"📁 Carpeta de salida: {options.output_folder}", 'info')
+            if options.use_prefix:
                 self.log_message('📝 Los archivos tendrán el prefijo "Nuevo_"', 'info')
+        if expander.journal and expander.journal.completed():
+            self.log_message(f"📓 Reanudando lote: {expander.journal.completed()} archivos ya completados "
+                             f"se omitirán", 'warning')
         
-        for i, file_path in enumerate(self.file_paths, 1):
-            try:
-                # Actualizar estado
-                filename = os.path.basename(file_path)
-                display_name = filename[:30] + "..." if len(filename) > 30 else filename
-                self.root.after(0, self.status_var.set, 
-                              f"⏳ Procesando {i}/{len(self.file_paths)}: {display_name}")
-                
-                # Determinar ruta de salida
-                if use_custom_output:
-                    output_filename = f"Nuevo_{filename}" if use_prefix else filename
-                    output_path = os.path.join(output_folder, output_filename)
-                    success = self.process_file_with_output(file_path, output_path, add_bytes, mode)
-                else:
-                    if use_prefix:
-                        # Misma carpeta, pero con prefijo
-                        dir_name = os.path.dirname(file_path)
-                        output_filename = f"Nuevo_{filename}"
-                        output_path = os.path.join(dir_name, output_filename)
-                        success = self.process_file_with_output(file_path, output_path, add_bytes, mode)
-                    else:
-                        # Modificar archivo original
-                        success = self.process_file_original(file_path, add_bytes, mode)
-                
-                if success:
-                    success_count += 1
-                    output_name = os.path.basename(output_path) if use_custom_output or use_prefix else filename
-                    self.root.after(0, self.log_message, f"✓ {output_name} - Completado", 'success')
-                else:
-                    error_count += 1
-                    self.root.after(0, self.log_message, f"✗ {filename} - Error", 'error')
-                
-                # Actualizar progreso cada 10 archivos
-                if i % 10 == 0 or i == len(self.file_paths):
-                    percent = (i / len(self.file_paths)) * 100
-                    self.root.after(0, self.status_var.set, 
-                                  f"⏳ Progreso: {i}/{len(self.file_paths)} ({percent:.1f}%)")
-                
-            except Exception as e:
-                error_count += 1
-                self.root.after(0, self.log_message, f"✗ {os.path.basename(file_path)} - Error: {str(e)[:50]}", 'error')
+        # Sin carpeta de salida se escribe en el disco de cada archivo, ya en la caché
+        if options.output_folder:
+            device_of = expander.device_of
+        else:
+            device_of = lambda file_path: self.file_paths.get(file_path).dev
+        
+        def file_done(index, result):
+            file_path = file_paths[index]
+            if isinstance(result, Cancelled):
+                self.post_file_state(file_path, None)
+            elif isinstance(result, Exception):
+                self.log_message(f"✗ {os.path.basename(file_path)} - Error: {str(result)[:50]}", 'error')
+                self.post_file_state(file_path, 'error')
+            else:
+                self.log_message(f"✓ {os.path.basename(result['output'])} - Completado "
+                                 f"({describe_result(result)})", 'success')
+                self.post_file_state(file_path, 'done')
+            
+            # La barra de estado solo muestra el último valor de cada vuelta
+            report.total_files = len(file_paths)
+            self.set_status(report.progress_text())
+        
+        results = expander.run(file_paths, file_done, device_of, report)
+        
+        # Si el escaneo de la carpeta sigue en curso, procesar los lotes según llegan
+        if pending_files is not None:
+            for batch in iter(pending_files.get, None):
+                if control.cancelled:
+                    break
+                offset = len(file_paths)
+                file_paths.extend(batch)
+                results.extend(expander.run(batch, lambda index, result: file_done(offset + index, result),
+                                            device_of, report))
+        report.finish()
+        expander.finish(report.errors + report.cancelled)
+        if options.manifest:
+            self.save_manifest(file_paths, options, results)
+        if expander.undo and expander.undo.count:
+            self.log_message(f"↩ Tamaños originales guardados para «Deshacer lote»: {expander.undo.path}", 'info')
+        
+        # Combinar resultados en el orden original de la lista
+        failed_paths = []
+        updated_sizes = []
+        added = 0
+        for file_path, result in zip(file_paths, results):
+            if isinstance(result, Cancelled):
+                continue
+            if isinstance(result, Exception):
+                failed_paths.append(file_path)
+                continue
+            added += result['added']
+            if options.in_place:
+                updated_sizes.append((file_path, result['size']))
         
         # Finalizar
-        self.root.after(0, self.process_complete, success_count, error_count)
+        self.post_ui(self.process_complete, len(updated_sizes) if options.in_place else
+                     len(results) - len(failed_paths) - report.cancelled,
+                     len(failed_paths), failed_paths, updated_sizes, report.cancelled, added)
     
-    def process_file_with_output(self, input_path, output_path, add_bytes, mode):
-        """Procesa un archivo guardando en una nueva ubicación."""
+    def save_manifest(self, file_paths, options, results):
+        """Guarda el manifiesto SHA-256 en la carpeta de salida (o la del primer archivo)."""
+        folder = options.output_folder or os.path.dirname(file_paths[0])
+        path = os.path.join(folder, f"kiz_manifiesto_{datetime.now():%Y%m%d_%H%M%S}.sha256")
         try:
-            # Copiar archivo original
-            shutil.copy2(input_path, output_path)
-            
-            # Expandir archivo copiado
-            if mode == "Agregar":
-                with open(output_path, 'ab') as file:
-                    file.write(b'\x00' * add_bytes)
-            else:  # Establecer tamaño
-                current_size = os.path.getsize(output_path)
-                if add_bytes > current_size:
-                    with open(output_path, 'ab') as file:
-                        file.write(b'\x00' * (add_bytes - current_size))
-            
-            return True
-        except Exception as e:
-            self.log_message(f"  Error procesando {os.path.basename(input_path)}: {str(e)[:50]}", 'error')
-            return False
+            count = write_manifest(path, results)
+            self.log_message(f"🔏 Manifiesto SHA-256 con {count} salidas: {path}", 'info')
+        except OSError as e:
+            self.log_message(f"✗ No se pudo guardar el manifiesto: {e}", 'error')
     
-    def process_file_original(self, file_path, add_bytes, mode):
-        """Procesa un archivo modificando el original."""
-        try:
-            if mode == "Agregar":
-                with open(file_path, 'ab') as file:
-                    file.write(b'\x00' * add_bytes)
-            else:  # Establecer tamaño
-                current_size = os.path.getsize(file_path)
-                if add_bytes > current_size:
-                    with open(file_path, 'ab') as file:
-                        file.write(b'\x00' * (add_bytes - current_size))
-            
-            return True
-        except Exception as e:
-            self.log_message(f"  Error procesando {os.path.basename(file_path)}: {str(e)[:50]}", 'error')
-            return False
+    def toggle_pause(self):
+        """Pausa o reanuda el lote en curso."""
+        if not self.control:
+            return
+        if self.control.paused:
+            self.control.resume()
+            self.pause_btn.config(text="⏸ Pausar")
+            self.log_message("▶ Procesamiento reanudado", 'info')
+        else:
+            self.control.pause()
+            self.pause_btn.config(text="▶ Reanudar")
+            self.log_message("⏸ Procesamiento en pausa", 'warning')
+            self.status_var.set("⏸ En pausa")
+    
+    def cancel_processing(self):
+        """Cancela el lote en curso; el archivo a medias vuelve a su estado original."""
+        if not self.control or self.control.cancelled:
+            return
+        self.control.cancel()
+        self.pause_btn.config(state='disabled', text="⏸ Pausar")
+        self.cancel_btn.config(state='disabled')
+        self.log_message("⏹ Cancelando... los archivos a medias se devolverán a su estado original", 'warning')
+        # No esperar más lotes del escaneo
+        if self.pending_files is not None:
+            self.pending_files.put(None)
+            self.pending_files = None
     
-    def process_complete(self, success_count, error_count):
+    def process_complete(self, success_count, error_count, failed_paths=(), updated_sizes=(), cancelled=0,
+                         total_added=0):
         """Finaliza el procesamiento."""
         self.processing = False
+        self.control = None
+        self.worker = None
         self.process_btn.config(state='normal', text="⚡ PROCESAR ARCHIVOS")
+        self.pause_btn.config(state='disabled', text="⏸ Pausar")
+        self.cancel_btn.config(state='disabled')
+        
+        # Los originales modificados cambian de tamaño: invalidar la caché
+        if updated_sizes:
+            for file_path, size in updated_sizes:
+                self.file_paths.invalidate(file_path, size)
+            self.update_file_list()
+            self.update_size_info()
         
         # Resumen
         self.log_message("=" * 50, 'header')
@@ -783,17 +1583,32 @@ class FileExpanderApp:
         
         if error_count > 0:
             self.log_message(f"✗ Archivos con error: {error_count}", 'error')
+            for file_path in failed_paths[:10]:
+                self.log_message(f"  • {file_path}", 'error')
+            if len(failed_paths) > 10:
+                self.log_message(f"  ... y {len(failed_paths) - 10} más", 'error')
         else:
             self.log_message(f"✗ Archivos con error: {error_count}", 'info')
+        if cancelled:
+            self.log_message(f"⏹ Archivos sin procesar por la cancelación: {cancelled}", 'warning')
         
         if success_count > 0:
-            total_added = self.calculate_total_added()
             self.log_message(f"📈 Total expandido: {self.format_size(total_added)}", 'info')
             
+            if self.last_report:
+                summary = self.last_report.summary()
+                self.log_message(f"⏱️ Tiempo: {format_duration(summary['seconds'])} | "
+                                 f"Escrito: {self.format_size(summary['bytes_written'])} a "
+                                 f"{self.format_size(summary['bytes_per_second'])}/s | "
+                                 f"{summary['files_per_second']:.1f} archivos/s", 'info')
+            
             # Mostrar ubicación de los archivos
             if self.custom_output_var.get():
                 self.log_message(f"📁 Archivos guardados en: {self.output_folder.get()}", 'info')
         
+        if cancelled:
+            self.status_var.set(f"⏹ Procesamiento cancelado - {success_count} exitosos, {error_count} errores")
+            return
         self.status_var.set(f"✅ Procesamiento completado - {success_count} exitosos, {error_count} errores")
         
         # Mostrar mensaje final
@@ -806,22 +1621,109 @@ class FileExpanderApp:
                           f"✓ Exitosos: {success_count}\n"
                           f"✗ Errores: {error_count}")
     
-    def calculate_total_added(self):
-        """Calcula el total de bytes agregados."""
+    def export_report(self):
+        """Guarda las métricas de la última ejecución en JSON o CSV."""
+        if not self.last_report:
+            messagebox.showwarning("Sin informe", "Todavía no se ha procesado ningún lote")
+            return
+        
+        path = filedialog.asksaveasfilename(title="Exportar informe",
+                                            defaultextension=".json",
+                                            initialfile=f"kiz_informe_{datetime.now():%Y%m%d_%H%M%S}.json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if not path:
+            return
+        
         try:
-            size_value = float(self.size_entry.get())
-            unit = self.unit_var.get()
-            
-            if unit == "KB":
-                add_bytes = int(size_value * 1024)
-            elif unit == "MB":
-                add_bytes = int(size_value * 1024 * 1024)
-            else:
-                add_bytes = int(size_value)
-            
-            return add_bytes * len(self.file_paths)
-        except:
-            return 0
+            self.last_report.export(path)
+            self.log_message(f"📊 Informe guardado en: {path}", 'success')
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo guardar el informe: {e}")
+    
+    def undo_batch(self):
+        """Devuelve a su tamaño original los archivos de un lote procesado en su sitio."""
+        if self.processing:
+            messagebox.showwarning("Procesando", "Espera a que termine el procesamiento en curso")
+            return
+        
+        path = filedialog.askopenfilename(title="Deshacer lote",
+                                          initialdir=UNDO_DIR if os.path.isdir(UNDO_DIR) else None,
+                                          filetypes=[("Manifiesto de tamaños", "*.kizundo"),
+                                                     ("Todos los archivos", "*.*")])
+        if not path:
+            return
+        
+        try:
+            fill, entries = SizeManifest.read(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"No se pudo leer el manifiesto: {e}")
+            return
+        if not entries:
+            messagebox.showinfo("Deshacer lote", "El manifiesto no tiene archivos")
+            return
+        
+        try:
+            workers = max(1, self.workers_var.get())
+            per_device = max(1, self.per_device_var.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "El número de hilos no es válido")
+            return
+        
+        added = sum(final - original for _, original, final in entries)
+        if not messagebox.askyesno("Confirmar",
+                                   f"Se recortarán {len(entries)} archivos a su tamaño original "
+                                   f"({self.format_size(added)} de relleno).\n\n"
+                                   f"Solo se recorta si el final sigue siendo el relleno agregado.\n"
+                                   f"¿Continuar?"):
+            return
+        
+        self.processing = True
+        self.process_btn.config(state='disabled', text="⏳ DESHACIENDO...")
+        self.status_var.set("⏳ Restaurando tamaños originales...")
+        self.log_message(f"↩ Deshaciendo lote de {len(entries)} archivos: {path}", 'header')
+        self.worker = threading.Thread(target=self.undo_batch_thread, args=(entries, fill, workers, per_device),
+                                       daemon=True)
+        self.worker.start()
+    
+    def undo_batch_thread(self, entries, fill, workers, per_device):
+        """Hilo para restaurar los tamaños de un manifiesto."""
+        def file_done(index, result):
+            if isinstance(result, Exception):
+                self.log_message(f"✗ {os.path.basename(entries[index][0])} - {str(result)[:80]}", 'error')
+        
+        try:
+            results = restore_sizes(entries, fill, workers, per_device, on_done=file_done)
+        except ValueError as e:
+            self.log_message(f"✗ No se pudo deshacer el lote: {e}", 'error')
+            results = [e] * len(entries)
+        self.post_ui(self.undo_complete, entries, results)
+    
+    def undo_complete(self, entries, results):
+        """Finaliza la restauración de tamaños."""
+        self.processing = False
+        self.worker = None
+        self.process_btn.config(state='normal', text="⚡ PROCESAR ARCHIVOS")
+        
+        restored = 0
+        skipped = 0
+        removed = 0
+        for (file_path, _, _), result in zip(entries, results):
+            if isinstance(result, Exception):
+                continue
+            if result.get('skipped'):
+                skipped += 1
+                continue
+            restored += 1
+            removed += result['removed']
+            self.file_paths.invalidate(file_path, result['size'])
+        errors = len(results) - restored - skipped
+        if restored:
+            self.update_file_list()
+            self.update_size_info()
+        
+        self.log_message(f"↩ Restaurados: {restored} | Ya en su tamaño: {skipped} | Con error: {errors} | "
+                         f"Recortado: {self.format_size(removed)}", 'error' if errors else 'success')
+        self.status_var.set(f"↩ Lote deshecho - {restored} restaurados, {errors} errores")
     
     def on_closing(self):
         """Maneja el cierre de la ventana."""
@@ -830,12 +1732,29 @@ class FileExpanderApp:
                                       "Hay un procesamiento en curso.\n¿Realmente quieres salir?"):
                 return
         
+        if self.scanner:
+            self.scanner.cancel()
+        
+        # Cancelar el lote y esperar a que el archivo en curso quede intacto o completo
+        if self.worker:
+            self.cancel_processing()
+            self.worker.join(timeout=10)
+        
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+        
         self.root.quit()
         self.root.destroy()
 
 def main():
     """Función principal."""
+    # Con argumentos se usa la línea de comandos, sin cargar tkinter
+    if len(sys.argv) > 1:
+        sys.exit(kiz_engine.main(sys.argv[1:]))
+    
     try:
+        load_tkinter()
         root = tk.Tk()
         
         # Configurar DPI awareness (solo Windows)
@@ -0,0 +1,284 @@
+"""Banco de pruebas del motor de expansión de Kiz Space Editor.
+
+Genera árboles sintéticos en una carpeta temporal, ejecuta cada estrategia
+con distintos números de hilos y mide MB/s, archivos/s, latencia por archivo
+(p50/p99) y memoria máxima. Los resultados se guardan en JSON para poder
+compararlos entre versiones:
+
+    python kiz_benchmark.py --json base.json
+    python kiz_benchmark.py --compare base.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from kiz_engine import (PADDING_STRATEGIES, DEFAULT_CHUNK_SIZE, ExpansionOptions, Expander,
+                        format_size, parse_fill, parse_size)
+
+# Escenarios: lista de (cantidad de archivos, tamaño de cada uno)
+SCENARIOS = {
+    "muchos": [(1000, 4 * 1024)],
+    "grandes": [(4, 32 * 1024 * 1024)],
+    "mixto": [(200, 64 * 1024), (50, 1024 * 1024), (2, 32 * 1024 * 1024)]
+}
+
+TARGETS = ["original", "salida"]
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+def generate_tree(folder, scenario, scale=1.0):
+    """Crea los archivos de un escenario y devuelve [(ruta, tamaño)]."""
+    files = []
+    os.makedirs(folder, exist_ok=True)
+    for group, (count, size) in enumerate(SCENARIOS[scenario]):
+        count = max(1, int(count * scale))
+        size = max(1, int(size * scale))
+        for i in range(count):
+            path = os.path.join(folder, f"{group}_{i:06d}.bin")
+            with open(path, 'wb') as file:
+                remaining = size
+                while remaining > 0:
+                    n = min(remaining, len(BLOCK))
+                    file.write(BLOCK[:n])
+                    remaining -= n
+            files.append((path, size))
+    return files
+
+
+def percentile(values, fraction):
+    """Percentil por el método del rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss():
+    """Memoria residente máxima del proceso en bytes, o None si no se puede medir."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux la da en KB y macOS en bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case):
+    """Ejecuta un caso en el proceso actual y devuelve sus métricas."""
+    files = case['files']
+    output_folder = case['output_folder']
+    options = ExpansionOptions(case['pad'],
+                               mode="Agregar",
+                               output_folder=output_folder,
+                               strategy=case['strategy'],
+                               chunk_size=case['chunk_size'],
+                               workers=case['workers'],
+                               per_device=case['workers'],
+                               fill=case['fill'],
+                               undo=False)
+    expander = Expander(options)
+    latencies = []
+    
+    def timed_expand(file_path):
+        start = time.perf_counter()
+        result = expander.expand(file_path)
+        latencies.append(time.perf_counter() - start)
+        return result
+    
+    start = time.perf_counter()
+    results = expander.executor.run([path for path, _ in files], timed_expand, expander.device_of)
+    elapsed = time.perf_counter() - start
+    
+    errors = [result for result in results if isinstance(result, Exception)]
+    written = 0
+    for result in results:
+        if not isinstance(result, Exception):
+            written += result['written']
+    
+    return {
+        'files': len(files),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'bytes': written,
+        'mb_s': written / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+        'files_s': len(files) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss': peak_rss()
+    }
+
+
+def reset_tree(files, output_folder):
+    """Devuelve los archivos a su tamaño original y vacía la carpeta de salida."""
+    for path, size in files:
+        os.truncate(path, size)
+    if output_folder:
+        shutil.rmtree(output_folder, ignore_errors=True)
+        os.makedirs(output_folder)
+
+
+def run_benchmark(args):
+    """Ejecuta todos los casos y devuelve la lista de resultados."""
+    results = []
+    base = tempfile.mkdtemp(prefix="kiz_bench_", dir=args.dir)
+    # Cada caso corre en un proceso nuevo para medir su memoria por separado
+    context = multiprocessing.get_context("spawn")
+    try:
+        for scenario in args.scenarios:
+            files = generate_tree(os.path.join(base, scenario), scenario, args.scale)
+            output_root = os.path.join(base, scenario + "_salida")
+            
+            for target in args.targets:
+                for strategy, fill in [(strategy, fill) for strategy in args.strategies for fill in args.fills]:
+                    for workers in args.workers:
+                        case_name = f"{scenario}/{target}/{strategy}/h{workers}"
+                        # El relleno de ceros conserva los nombres de casos de versiones anteriores
+                        if fill != "00":
+                            case_name += f"/{fill}"
+                        output_folder = output_root if target == "salida" else None
+                        samples = []
+                        for _ in range(args.repeat):
+                            reset_tree(files, output_folder)
+                            if args.sync and hasattr(os, 'sync'):
+                                os.sync()
+                            case = {'files': files, 'output_folder': output_folder, 'pad': args.pad,
+                                    'strategy': strategy, 'chunk_size': args.chunk_size, 'workers': workers,
+                                    'fill': fill}
+                            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                                samples.append(pool.submit(run_case, case).result())
+                        
+                        # De las repeticiones se queda la de mediana de velocidad
+                        samples.sort(key=lambda sample: sample['mb_s'])
+                        result = samples[len(samples) // 2]
+                        result.update(case=case_name, scenario=scenario, target=target,
+                                      strategy=strategy, workers=workers, fill=fill)
+                        results.append(result)
+                        if not args.quiet:
+                            print(format_row(result), flush=True)
+            
+            reset_tree(files, None)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+TABLE_HEADER = f"{'caso':<40} {'MB/s':>9} {'arch/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS':>10}"
+
+
+def format_row(result):
+    """Formatea un resultado como fila de la tabla."""
+    rss = format_size(result['peak_rss']) if result['peak_rss'] else "-"
+    return (f"{result['case']:<40} {result['mb_s']:>9.1f} {result['files_s']:>9.1f} "
+            f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {rss:>10}")
+
+
+def compare(results, baseline_path, threshold):
+    """Compara MB/s con una ejecución anterior; devuelve los casos que empeoraron."""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {result['case']: result for result in json.load(file)['results']}
+    
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['case'])
+        if not previous or not previous['mb_s']:
+            continue
+        change = (result['mb_s'] - previous['mb_s']) / previous['mb_s']
+        if change < -threshold:
+            regressions.append((result['case'], previous['mb_s'], result['mb_s'], change))
+    return regressions
+
+
+def parse_list(text, convert=str):
+    """Convierte "a,b,c" en una lista."""
+    return [convert(item.strip()) for item in text.split(",") if item.strip()]
+
+
+def main(argv=None):
+    """Punto de entrada; devuelve 1 si se detectan regresiones."""
+    parser = argparse.ArgumentParser(prog="kiz_benchmark",
+                                     description="Mide el rendimiento del motor de expansión.")
+    parser.add_argument("--scenarios", type=parse_list, default=list(SCENARIOS),
+                        help=f"escenarios separados por comas (por defecto: {','.join(SCENARIOS)})")
+    parser.add_argument("--targets", type=parse_list, default=TARGETS,
+                        help="original y/o salida (por defecto: ambos)")
+    parser.add_argument("--strategies", type=parse_list, default=PADDING_STRATEGIES,
+                        help=f"estrategias de relleno (por defecto: {','.join(PADDING_STRATEGIES)})")
+    parser.add_argument("--fills", type=parse_list, default=["00"],
+                        help="rellenos a probar, p. ej. 00,FF,aleatorio:1 (por defecto: 00)")
+    parser.add_argument("--workers", type=lambda text: parse_list(text, int), default=[1, 4],
+                        help="números de hilos a probar (por defecto: 1,4)")
+    parser.add_argument("--pad", type=parse_size, default=1024 * 1024,
+                        help="bytes a agregar a cada archivo (por defecto: 1MB)")
+    parser.add_argument("--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE,
+                        help="bloque de escritura (por defecto: 1MB)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiplica cantidad y tamaño de los archivos (por defecto: 1)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="repeticiones por caso, se usa la mediana (por defecto: 3)")
+    parser.add_argument("--dir", help="carpeta donde crear los archivos temporales")
+    parser.add_argument("--sync", action="store_true",
+                        help="vaciar la caché de escritura (os.sync) antes de cada caso")
+    parser.add_argument("--json", metavar="ARCHIVO", help="guardar los resultados en JSON")
+    parser.add_argument("--compare", metavar="ARCHIVO", help="comparar con un JSON anterior")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="caída de MB/s que cuenta como regresión (por defecto: 0.10)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no mostrar la tabla")
+    args = parser.parse_args(argv)
+    
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"escenario desconocido: {scenario}")
+    for target in args.targets:
+        if target not in TARGETS:
+            parser.error(f"destino desconocido: {target}")
+    for strategy in args.strategies:
+        if strategy not in PADDING_STRATEGIES:
+            parser.error(f"estrategia desconocida: {strategy}")
+    for fill in args.fills:
+        try:
+            parse_fill(fill)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if not args.quiet:
+        print(TABLE_HEADER)
+    results = run_benchmark(args)
+    
+    if args.json:
+        report = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'pad': args.pad, 'chunk_size': args.chunk_size, 'scale': args.scale,
+                         'repeat': args.repeat},
+            'results': results
+        }
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+    
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for case, before, after, change in regressions:
+            print(f"REGRESIÓN {case}: {before:.1f} -> {after:.1f} MB/s ({change:+.0%})")
+        if regressions:
+            return 1
+        print("Sin regresiones")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
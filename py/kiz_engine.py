@@ -0,0 +1,2900 @@
+"""Motor de expansión de Kiz Space Editor, independiente de la interfaz.
+
+Se puede importar desde otros scripts o usar como herramienta de línea de
+comandos:
+
+    python kiz_engine.py --size 100KB --mode agregar archivo.bin carpeta/
+"""
+import os
+import sys
+import errno
+import argparse
+import threading
+import collections
+import queue
+import shutil
+import signal
+import tempfile
+import stat
+import time
+import csv
+import json
+import hashlib
+import itertools
+import operator
+import struct
+import select
+import ctypes
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Tamaño del bloque reutilizable con el que se escribe el relleno
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Estrategias para extender un archivo con ceros:
+#   Escribir    -> escribe los ceros bloque a bloque
+#   Disperso    -> ftruncate, el sistema de archivos crea un hueco en O(1)
+#   Preasignado -> posix_fallocate, reserva bloques reales sin escribirlos
+PADDING_STRATEGIES = ["Escribir", "Disperso", "Preasignado"]
+
+# ioctl de Linux para clonar un archivo compartiendo extents (btrfs, XFS...)
+FICLONE = 0x40049409
+
+# Errores con los que una vía de copia del kernel no está disponible y se
+# pasa a la siguiente
+OFFLOAD_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                  errno.ENOTSOCK, errno.EBADF}
+
+# Modos de expansión
+MODES = ["Agregar", "Establecer tamaño", "Alinear a múltiplo", "Siguiente potencia de 2"]
+
+# Durabilidad: sin fsync, fsync de cada archivo o un único volcado al final del lote
+DURABILITY = ["Ninguna", "Por archivo", "Por lote"]
+
+# Qué hacer con los ceros que un archivo ya tiene al final en modo Agregar
+PADDING_CHECKS = ["Ignorar", "Informar", "Normalizar"]
+
+# Nombre de cada salida cuando se generan varios tamaños de un mismo archivo.
+# Campos: {name} nombre completo, {stem} sin extensión, {ext} extensión,
+# {size} tamaño pedido ("16MB") e {index} posición del tamaño en la lista
+DEFAULT_NAME_TEMPLATE = "{stem}_{size}{ext}"
+
+# A partir de cuántos bytes por archivo el SHA-256 del manifiesto se calcula en otro hilo
+HASH_THREAD_MIN = 4 * 1024 * 1024
+
+# Sufijo de los archivos temporales donde se construyen las salidas
+TEMP_SUFFIX = ".kiztmp"
+
+# Prioridad del proceso frente a otros servicios: (nice, clase de E/S, nivel de E/S).
+# La clase 2 es "best effort" con niveles de 0 a 7 y la 3 solo usa el disco libre
+PRIORITIES = {"Normal": None, "Baja": (10, 2, 7), "Inactiva": (19, 3, 0)}
+
+# Cada cuántos bytes escritos se pide al sistema que saque de su caché lo ya escrito
+DROP_CACHE_WINDOW = 32 * 1024 * 1024
+
+# Número de la llamada ioprio_set según la arquitectura (Linux)
+IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'armv7l': 314,
+              'ppc64le': 273, 's390x': 282, 'riscv64': 30}
+
+UNITS = {
+    "BYTES": 1,
+    "B": 1,
+    "KB": 1024,
+    "MB": 1024 * 1024,
+    "GB": 1024 * 1024 * 1024
+}
+
+
+class FileEntry:
+    """Datos de un archivo del registro tomados de su stat."""
+    
+    __slots__ = ('path', 'size', 'dev', 'mtime')
+    
+    def __init__(self, path, st):
+        self.path = path
+        self.size = st.st_size
+        self.dev = st.st_dev
+        self.mtime = st.st_mtime_ns
+
+
+class FileRegistry:
+    """Lista de archivos sin duplicados que conserva el orden de inserción.
+    
+    Cada archivo se identifica por (st_dev, st_ino), o por su ruta real si el
+    sistema de archivos no da número de inodo, así los enlaces duros y las
+    distintas formas de escribir una misma ruta cuentan como un único archivo.
+    Agregar, quitar y consultar son O(1).
+    
+    El registro guarda también el stat de cada archivo y mantiene el tamaño
+    total, mínimo y máximo al día, para no volver a consultar el disco.
+    """
+    
+    def __init__(self):
+        self._entries = {}  # clave -> FileEntry, en orden de inserción
+        self._keys = {}     # ruta -> clave
+        self.total_size = 0
+        self._min_size = None
+        self._max_size = None
+        self._extremes_stale = False
+        self.version = 0  # cambia con cada modificación, para las vistas
+        # Cantidad, suma y potencias de 2 exactas por bit_length() del tamaño
+        self._bit_counts = collections.Counter()
+        self._bit_sums = collections.Counter()
+        self._pow2_counts = collections.Counter()
+        self._growth_cache = {}  # múltiplo -> crecimiento, válido para _growth_version
+        self._growth_version = None
+    
+    @staticmethod
+    def file_key(path, st):
+        """Devuelve la clave que identifica al archivo en el registro."""
+        if st.st_ino:
+            return (st.st_dev, st.st_ino)
+        return os.path.normcase(os.path.realpath(path))
+    
+    def add(self, path, st=None):
+        """Agrega un archivo regular; devuelve False si no existe o ya estaba."""
+        if path in self._keys:
+            return False
+        
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        
+        key = self.file_key(path, st)
+        if key in self._entries:
+            return False
+        
+        self._entries[key] = FileEntry(path, st)
+        self._keys[path] = key
+        self._count_size(st.st_size)
+        self.version += 1
+        return True
+    
+    def remove(self, path):
+        """Quita un archivo del registro; devuelve False si no estaba."""
+        key = self._keys.pop(path, None)
+        if key is None:
+            return False
+        self._discount_size(self._entries.pop(key).size)
+        self.version += 1
+        return True
+    
+    def invalidate(self, path, size=None):
+        """Actualiza el tamaño en caché de un archivo ya procesado.
+        
+        Si no se indica `size` se vuelve a consultar el stat del archivo.
+        """
+        key = self._keys.get(path)
+        if key is None:
+            return False
+        
+        entry = self._entries[key]
+        if size is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            size = st.st_size
+            entry.mtime = st.st_mtime_ns
+        
+        self._discount_size(entry.size)
+        entry.size = size
+        self._count_size(size)
+        self.version += 1
+        return True
+    
+    def get(self, path):
+        """Devuelve la entrada en caché de un archivo o None."""
+        key = self._keys.get(path)
+        return self._entries[key] if key is not None else None
+    
+    def entries(self):
+        """Itera sobre las entradas en orden de inserción."""
+        return iter(self._entries.values())
+    
+    def clear(self):
+        """Vacía el registro."""
+        self._entries.clear()
+        self._keys.clear()
+        self.total_size = 0
+        self._min_size = None
+        self._max_size = None
+        self._extremes_stale = False
+        self._bit_counts.clear()
+        self._bit_sums.clear()
+        self._pow2_counts.clear()
+        self.version += 1
+    
+    @property
+    def min_size(self):
+        """Tamaño del archivo más pequeño."""
+        self._refresh_extremes()
+        return self._min_size or 0
+    
+    @property
+    def max_size(self):
+        """Tamaño del archivo más grande."""
+        self._refresh_extremes()
+        return self._max_size or 0
+    
+    @property
+    def avg_size(self):
+        """Tamaño medio de los archivos."""
+        return self.total_size / len(self._entries) if self._entries else 0
+    
+    def aligned_growth(self, multiple):
+        """Bytes que se agregan al redondear cada tamaño al siguiente múltiplo de `multiple`.
+        
+        Recorre los tamaños en caché en una sola pasada de map() sobre funciones
+        integradas, sin bucle de Python, y guarda el resultado hasta que el
+        registro cambie. Lanza ValueError si `multiple` no es mayor que 0.
+        """
+        if multiple <= 0:
+            raise ValueError("el múltiplo debe ser mayor que 0")
+        if self._growth_version != self.version:
+            self._growth_cache.clear()
+            self._growth_version = self.version
+        growth = self._growth_cache.get(multiple)
+        if growth is None:
+            sizes = map(operator.attrgetter('size'), self._entries.values())
+            # (-size) % multiple es lo que le falta a size para el siguiente múltiplo
+            growth = sum(map(multiple.__rmod__, map(operator.neg, sizes)))
+            self._growth_cache[multiple] = growth
+        return growth
+    
+    def power_of_two_growth(self):
+        """Bytes que se agregan al llevar cada tamaño a la siguiente potencia de 2.
+        
+        Se calcula con los contadores por bit_length(), en O(64) aunque haya
+        millones de archivos.
+        """
+        growth = 0
+        for length, count in self._bit_counts.items():
+            if length == 0:
+                continue  # los archivos vacíos no crecen
+            exact = self._pow2_counts[length]
+            growth += (count - exact) * (1 << length) - (self._bit_sums[length] - exact * (1 << (length - 1)))
+        return growth
+    
+    def _count_size(self, size):
+        self.total_size += size
+        length = size.bit_length()
+        self._bit_counts[length] += 1
+        self._bit_sums[length] += size
+        if size and not size & (size - 1):
+            self._pow2_counts[length] += 1
+        if not self._extremes_stale:
+            if self._min_size is None or size < self._min_size:
+                self._min_size = size
+            if self._max_size is None or size > self._max_size:
+                self._max_size = size
+    
+    def _discount_size(self, size):
+        self.total_size -= size
+        length = size.bit_length()
+        self._bit_counts[length] -= 1
+        self._bit_sums[length] -= size
+        if size and not size & (size - 1):
+            self._pow2_counts[length] -= 1
+        # Solo hace falta recalcular si se quitó uno de los extremos
+        if size == self._min_size or size == self._max_size:
+            self._extremes_stale = True
+    
+    def _refresh_extremes(self):
+        if self._extremes_stale:
+            sizes = [entry.size for entry in self._entries.values()]
+            self._min_size = min(sizes) if sizes else None
+            self._max_size = max(sizes) if sizes else None
+            self._extremes_stale = False
+    
+    def __contains__(self, path):
+        return path in self._keys
+    
+    def __iter__(self):
+        return (entry.path for entry in self._entries.values())
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class FolderScanner:
+    """Recorre una carpeta con os.scandir en un hilo y entrega los archivos por lotes.
+    
+    Cada lote es una lista de (ruta, stat) que se deja en la cola `batches`;
+    al terminar, o al cancelar, se deja None en la cola.
+    """
+    
+    def __init__(self, folder, batch_size=1000):
+        self.folder = folder
+        self.batch_size = batch_size
+        self.batches = queue.Queue()
+        self.files_found = 0
+        self.bytes_found = 0
+        self.errors = 0
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        """Inicia el escaneo en segundo plano."""
+        self._thread.start()
+    
+    def cancel(self):
+        """Pide al escáner que se detenga lo antes posible."""
+        self._cancel.set()
+    
+    @property
+    def cancelled(self):
+        """Indica si el escaneo fue cancelado."""
+        return self._cancel.is_set()
+    
+    def _run(self):
+        batch = []
+        pending_dirs = [self.folder]
+        
+        while pending_dirs and not self._cancel.is_set():
+            subdirs = []
+            try:
+                with os.scandir(pending_dirs.pop()) as entries:
+                    for entry in entries:
+                        if self._cancel.is_set():
+                            break
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                            st = entry.stat()
+                        except OSError:
+                            self.errors += 1
+                            continue
+                        
+                        batch.append((entry.path, st))
+                        self.files_found += 1
+                        self.bytes_found += st.st_size
+                        if len(batch) >= self.batch_size:
+                            self.batches.put(batch)
+                            batch = []
+            except OSError:
+                self.errors += 1
+            
+            # Recorrido en profundidad en el mismo orden que os.walk
+            pending_dirs.extend(reversed(subdirs))
+        
+        if batch:
+            self.batches.put(batch)
+        self.batches.put(None)
+
+
+class Cancelled(Exception):
+    """Se canceló la expansión antes de terminar el archivo."""
+    
+    def __init__(self, message="Cancelado"):
+        super().__init__(message)
+
+
+class TokenBucket:
+    """Limita un ritmo (bytes o archivos por segundo) con un cubo de fichas.
+    
+    Se acumulan hasta `rate` fichas por segundo, como mucho las de un segundo.
+    Un consumo mayor que el cubo se permite y deja fichas en negativo, que se
+    pagan esperando. Con `rate` 0 no hay límite.
+    """
+    
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+    
+    def set_rate(self, rate):
+        """Cambia el límite; los hilos que esperan lo aplican en su próximo intento."""
+        with self._lock:
+            self._refill()
+            rate = max(0, rate or 0)
+            # Al pasar de sin límite a un límite se empieza con el cubo lleno
+            self._tokens = rate if not self.rate else min(self._tokens, rate)
+            self.rate = rate
+    
+    def take(self, amount):
+        """Consume `amount` fichas si hay; si no, devuelve los segundos que conviene esperar."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            needed = min(amount, self.rate)
+            if self._tokens >= needed:
+                self._tokens -= amount
+                return 0.0
+            return (needed - self._tokens) / self.rate
+    
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+class RateLimits:
+    """Límites de bytes escritos y archivos abiertos por segundo, modificables en marcha.
+    
+    Varios lotes pueden compartir los mismos límites pasándolos a su
+    BatchControl, como hace el servidor de trabajos.
+    """
+    
+    def __init__(self, bytes_per_second=0, files_per_second=0):
+        self.bytes = TokenBucket(bytes_per_second)
+        self.files = TokenBucket(files_per_second)
+    
+    def set(self, bytes_per_second=None, files_per_second=None):
+        """Cambia los límites indicados; 0 los quita."""
+        if bytes_per_second is not None:
+            self.bytes.set_rate(bytes_per_second)
+        if files_per_second is not None:
+            self.files.set_rate(files_per_second)
+    
+    def describe(self):
+        """Texto con los límites actuales."""
+        rate = f"{format_size(self.bytes.rate)}/s" if self.bytes.rate else "sin límite"
+        files = f"{self.files.rate:g} archivos/s" if self.files.rate else "sin límite de archivos"
+        return f"{rate}, {files}"
+
+
+class BatchControl:
+    """Cancelación, pausa y límite de ritmo cooperativos de un lote.
+    
+    Los hilos de trabajo llaman a checkpoint() entre bloques de escritura, así
+    una pausa o una cancelación surten efecto en milisegundos aunque el archivo
+    en curso sea de varios GB, y a throttle() tras escribir cada bloque.
+    """
+    
+    def __init__(self, limits=None):
+        self.limits = limits or RateLimits()
+        self._cancel = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+    
+    def cancel(self):
+        """Pide cancelar el lote; también despierta a los hilos en pausa."""
+        self._cancel.set()
+        self._running.set()
+    
+    def pause(self):
+        """Detiene los hilos en su próximo punto de control."""
+        if not self._cancel.is_set():
+            self._running.clear()
+    
+    def resume(self):
+        """Reanuda los hilos en pausa."""
+        self._running.set()
+    
+    @property
+    def cancelled(self):
+        """Indica si se pidió cancelar."""
+        return self._cancel.is_set()
+    
+    @property
+    def paused(self):
+        """Indica si el lote está en pausa."""
+        return not self._running.is_set()
+    
+    def checkpoint(self):
+        """Espera mientras el lote esté en pausa y lanza Cancelled si se canceló."""
+        if not self._running.is_set():
+            self._running.wait()
+        if self._cancel.is_set():
+            raise Cancelled()
+    
+    def throttle(self, nbytes=0, files=0):
+        """Espera lo necesario para respetar los límites de ritmo; lanza Cancelled si se cancela."""
+        for bucket, amount in ((self.limits.bytes, nbytes), (self.limits.files, files)):
+            if not amount or not bucket.rate:
+                continue
+            while True:
+                wait = bucket.take(amount)
+                if not wait:
+                    break
+                # En tramos cortos, para notar a tiempo un cambio de límite o una pausa
+                if self._cancel.wait(min(wait, 0.25)):
+                    raise Cancelled()
+                self.checkpoint()
+
+
+class BatchExecutor:
+    """Procesa elementos en un pool de hilos con un límite de concurrencia por dispositivo.
+    
+    Cada dispositivo (st_dev) tiene su propia cola y sus propios hilos, así un
+    disco lento no retiene los huecos del pool que podrían usar los demás.
+    """
+    
+    def __init__(self, workers=4, per_device=2):
+        self.workers = max(1, int(workers))
+        self.per_device = max(1, int(per_device))
+    
+    def run(self, items, func, device_of, on_done=None):
+        """Ejecuta `func(item)` para cada elemento y devuelve los resultados en orden.
+        
+        Las excepciones se devuelven en la posición del elemento que falló.
+        `on_done(index, result)` se llama desde el hilo trabajador al terminar cada
+        uno; si lanza una excepción se ignora, para que la cola se vacíe igualmente.
+        """
+        queues = {}
+        for index, item in enumerate(items):
+            try:
+                device = device_of(item)
+            except OSError:
+                device = None
+            queues.setdefault(device, collections.deque()).append((index, item))
+        
+        results = [None] * len(items)
+        slots = threading.BoundedSemaphore(self.workers)
+        
+        def device_worker(device_queue):
+            while True:
+                try:
+                    index, item = device_queue.popleft()
+                except IndexError:
+                    return
+                
+                with slots:
+                    try:
+                        results[index] = func(item)
+                    except Exception as e:
+                        results[index] = e
+                
+                if on_done:
+                    try:
+                        on_done(index, results[index])
+                    except Exception:
+                        # Un aviso que falla (p. ej. salida cerrada) no debe dejar archivos sin procesar
+                        pass
+        
+        threads = []
+        for device_queue in queues.values():
+            for _ in range(min(self.per_device, self.workers, len(device_queue))):
+                thread = threading.Thread(target=device_worker, args=(device_queue,), daemon=True)
+                thread.start()
+                threads.append(thread)
+        
+        for thread in threads:
+            thread.join()
+        
+        # Ningún hueco queda en None aunque un hilo haya terminado antes de tiempo
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = RuntimeError("el archivo no se llegó a procesar")
+        return results
+
+
+def clone_file(src, dst, size):
+    """Clona `src` en `dst` con reflink (btrfs, XFS...); devuelve False si no se puede."""
+    if size > 0 and fcntl is not None and sys.platform.startswith('linux'):
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            dst.seek(0, os.SEEK_END)
+            return True
+        except OSError:
+            pass
+    return False
+
+
+def copy_file_data(src, dst, size, chunk_size=DEFAULT_CHUNK_SIZE, control=None):
+    """Copia `size` bytes de `src` a `dst` (abiertos en binario) por la vía más rápida.
+    
+    Prueba reflink, copy_file_range y sendfile antes de copiar con un búfer; si
+    una copia rápida se queda corta, el búfer sigue desde donde quedó. Devuelve
+    el nombre del método usado y deja `dst` posicionado al final. Lanza OSError
+    si no se pudieron copiar los `size` bytes (el original se acortó).
+    Con un BatchControl se comprueba la pausa y la cancelación entre bloques.
+    """
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+    
+    if clone_file(src, dst, size):
+        return "reflink"
+    
+    offloads = []
+    if hasattr(os, 'copy_file_range'):
+        offloads.append(("copy_file_range",
+                         lambda offset, n: os.copy_file_range(src_fd, dst_fd, n, offset, offset)))
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        offloads.append(("sendfile",
+                         lambda offset, n: os.sendfile(dst_fd, src_fd, offset, n)))
+    
+    copied = 0
+    method = "búfer"
+    for name, copy_range in offloads:
+        copied = 0
+        try:
+            while copied < size:
+                if control:
+                    control.checkpoint()
+                n = copy_range(copied, min(chunk_size, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                if control:
+                    control.throttle(n)
+        except OSError as e:
+            if copied or e.errno not in OFFLOAD_ERRORS:
+                raise
+            continue
+        if copied == size:
+            dst.seek(0, os.SEEK_END)
+            return name
+        if copied:
+            # Copia corta: se termina con el búfer a partir de lo ya copiado
+            method = f"{name}+búfer"
+            break
+    
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    src.seek(copied)
+    dst.seek(copied)
+    while copied < size:
+        if control:
+            control.checkpoint()
+        n = src.readinto(view[:min(chunk_size, size - copied)])
+        if not n:
+            break
+        dst.write(view[:n])
+        copied += n
+        if control:
+            control.throttle(n)
+    if copied != size:
+        raise OSError(errno.EIO, f"se copiaron {copied} de {size} bytes: el original se acortó durante la copia")
+    return method
+
+
+def fan_out_copy(src, dsts, size, chunk_size=DEFAULT_CHUNK_SIZE, control=None):
+    """Copia `src` a varios destinos leyéndolo una sola vez; devuelve los métodos usados.
+    
+    Los destinos que se pueden clonar con reflink no necesitan leer nada; los
+    demás reciben cada bloque leído del original en la misma pasada.
+    """
+    pending = [dst for dst in dsts if not clone_file(src, dst, size)]
+    methods = ["reflink"] if len(pending) < len(dsts) else []
+    if len(pending) == 1:
+        methods.append(copy_file_data(src, pending[0], size, chunk_size, control))
+    elif pending:
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        src.seek(0)
+        while True:
+            if control:
+                control.checkpoint()
+            n = src.readinto(buffer)
+            if not n:
+                break
+            for dst in pending:
+                dst.write(view[:n])
+            if control:
+                control.throttle(n * len(pending))
+        methods.append("búfer")
+    return "+".join(methods)
+
+
+class FillPattern:
+    """Contenido del relleno: un patrón de bytes que se repite o datos aleatorios.
+    
+    Los patrones empiezan al principio del relleno de cada archivo. Los datos
+    aleatorios con semilla son reproducibles: dependen de la semilla y de la
+    ruta completa del archivo rellenado; sin semilla se usan os.urandom.
+    """
+    
+    def __init__(self, pattern=b"\0", random=False, seed=None):
+        self.pattern = bytes(pattern)
+        self.random = random
+        self.seed = seed
+    
+    @property
+    def zero(self):
+        """Indica si el relleno son ceros, que los huecos dispersos ya representan."""
+        return not self.random and not self.pattern.strip(b"\0")
+    
+    @property
+    def byte(self):
+        """Valor del byte si el patrón es un único byte repetido, si no None."""
+        if self.random or self.pattern.strip(self.pattern[:1]):
+            return None
+        return self.pattern[0]
+    
+    def buffer(self, chunk_size):
+        """Bloque de escritura precalculado, de un múltiplo exacto del largo del patrón.
+        
+        Al escribir bloques enteros el patrón nunca pierde la fase, así el
+        último bloque parcial puede cortarse del principio del mismo buffer.
+        """
+        length = max(len(self.pattern), chunk_size - chunk_size % len(self.pattern))
+        return memoryview(self.pattern * (length // len(self.pattern)))
+    
+    @staticmethod
+    def key(path):
+        """Clave de un archivo para el relleno con semilla: su ruta completa normalizada.
+        
+        Así dos archivos con el mismo nombre en carpetas distintas no reciben los mismos datos.
+        """
+        return os.path.normcase(os.path.abspath(path))
+    
+    def generator(self, key):
+        """Función n -> n bytes aleatorios para rellenar el archivo `key`."""
+        if self.seed is None:
+            return os.urandom
+        counter = itertools.count()
+        prefix = f"{self.seed}:{key}:".encode('utf-8', 'surrogateescape')
+        # shake_128 genera cualquier longitud en C, con el mismo resultado en todas las plataformas
+        return lambda n: hashlib.shake_128(prefix + str(next(counter)).encode()).digest(n)
+    
+    def __str__(self):
+        if self.random:
+            return "aleatorio" if self.seed is None else f"aleatorio:{self.seed}"
+        return self.pattern.hex().upper()
+
+
+def parse_fill(text):
+    """Convierte un texto de relleno en un FillPattern.
+    
+    Acepta bytes en hexadecimal ("00", "FF", "20", "DEADBEEF") y "aleatorio"
+    o "aleatorio:SEMILLA". Lanza ValueError si no es válido.
+    """
+    text = str(text).strip()
+    name, _, seed = text.partition(":")
+    if name.lower() in ("aleatorio", "random"):
+        return FillPattern(random=True, seed=seed.strip() or None)
+    
+    digits = text.replace(" ", "")
+    if digits.lower().startswith("0x"):
+        digits = digits[2:]
+    try:
+        pattern = bytes.fromhex(digits)
+    except ValueError:
+        raise ValueError(f"patrón de relleno inválido: {text}") from None
+    if not pattern:
+        raise ValueError("el patrón de relleno está vacío")
+    return FillPattern(pattern)
+
+
+class PaddingWriter:
+    """Escribe relleno en bloques de tamaño fijo reutilizando un único buffer.
+    
+    Con `drop_cache` pide al sistema que no conserve en su caché lo que se
+    escribe, para no desalojar las páginas que usan otros procesos.
+    """
+    
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, strategy="Escribir", control=None, fill=None,
+                 drop_cache=False):
+        self.chunk_size = max(1, int(chunk_size))
+        self.strategy = strategy
+        self.control = control
+        self.fill = fill or FillPattern()
+        self.drop_cache = drop_cache
+        self._buffer = self.fill.buffer(self.chunk_size) if not self.fill.random else None
+    
+    def pad(self, file, count, key="", sink=None):
+        """Extiende `file` con `count` bytes de relleno y devuelve (estrategia usada, segundos).
+        
+        `key` identifica el archivo para los rellenos aleatorios con semilla.
+        `sink(bloque)` recibe los bytes del relleno, aunque no se escriban.
+        """
+        start = time.perf_counter()
+        strategy = self.strategy
+        # Los huecos y la preasignación solo dejan ceros: otro relleno hay que escribirlo
+        if not self.fill.zero:
+            strategy = "Escribir"
+        if count > 0:
+            file.flush()
+            fd = file.fileno()
+            offset = os.fstat(fd).st_size
+            
+            if strategy == "Preasignado":
+                try:
+                    os.posix_fallocate(fd, offset, count)
+                except AttributeError:
+                    # posix_fallocate no existe en esta plataforma
+                    strategy = "Escribir"
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                        raise
+                    # El sistema de archivos no soporta la preasignación
+                    strategy = "Escribir"
+            elif strategy == "Disperso":
+                os.ftruncate(fd, offset + count)
+            
+            if strategy == "Escribir":
+                self.write(file, count, key, sink)
+            elif sink:
+                # Huecos o preasignación: el contenido son ceros que no se escriben
+                for chunk in self.chunks(count, key):
+                    sink(chunk)
+        return strategy, time.perf_counter() - start
+    
+    def write(self, file, count, key="", sink=None):
+        """Escribe `count` bytes de relleno bloque a bloque, respetando el límite de ritmo."""
+        control = self.control
+        window_start = dropped = file.tell() if self.drop_cache else 0
+        written = 0
+        for chunk in self.chunks(count, key):
+            file.write(chunk)
+            if sink:
+                sink(chunk)
+            if control:
+                control.throttle(len(chunk))
+            written += len(chunk)
+            if self.drop_cache and written >= DROP_CACHE_WINDOW:
+                # La primera llamada sobre una ventana inicia su escritura a disco; la
+                # siguiente, una ventana después, ya puede descartar sus páginas limpias
+                file.flush()
+                position = file.tell()
+                drop_cache(file.fileno(), dropped, position - dropped)
+                dropped, window_start = window_start, position
+                written = 0
+    
+    def chunks(self, count, key=""):
+        """Genera los bloques de `count` bytes de relleno, comprobando pausa y cancelación."""
+        remaining = count
+        control = self.control
+        buffer = self._buffer
+        generate = self.fill.generator(key) if buffer is None else None
+        step = len(buffer) if buffer is not None else self.chunk_size
+        while remaining > 0:
+            if control:
+                control.checkpoint()
+            n = min(remaining, step)
+            yield buffer[:n] if buffer is not None else generate(n)
+            remaining -= n
+
+
+class StreamHasher:
+    """SHA-256 de los bytes de un archivo, calculado en otro hilo mientras se escriben.
+    
+    hashlib suelta el GIL con bloques grandes, así el hash corre en otro núcleo
+    sin frenar al hilo que copia y rellena. La cola está acotada para que la
+    memoria no crezca si el hash va más lento que el disco. Con
+    `threaded=False` se calcula en el mismo hilo, más barato para archivos
+    pequeños.
+    
+    Los bloques que se pasan no deben modificarse después.
+    """
+    
+    def __init__(self, threaded=True, depth=8):
+        self._current = hashlib.sha256()
+        self._saved = {}
+        self._queue = None
+        if threaded:
+            self._queue = queue.Queue(depth)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    
+    def update(self, data):
+        """Añade un bloque al hash."""
+        if self._queue is not None:
+            self._queue.put(data)
+        else:
+            self._current.update(data)
+    
+    def save(self, name):
+        """Guarda el estado actual con un nombre."""
+        self._command(('save', name))
+    
+    def restore(self, name):
+        """Sigue desde una copia de un estado guardado.
+        
+        Así el contenido del original se calcula una sola vez para todas sus
+        salidas: cada una continúa desde el estado guardado tras la copia.
+        """
+        self._command(('restore', name))
+    
+    def digests(self):
+        """Termina y devuelve {nombre: hexdigest} de los estados guardados."""
+        self.close()
+        return {name: hasher.hexdigest() for name, hasher in self._saved.items()}
+    
+    def close(self):
+        """Detiene el hilo del hash."""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+    
+    def _command(self, command):
+        if self._queue is not None:
+            self._queue.put(command)
+        else:
+            self._apply(command)
+    
+    def _apply(self, command):
+        action, name = command
+        if action == 'save':
+            self._saved[name] = self._current.copy()
+        else:
+            self._current = self._saved[name].copy()
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, tuple):
+                self._apply(item)
+            else:
+                self._current.update(item)
+
+
+def hashed_copy(src, dsts, hasher, chunk_size=DEFAULT_CHUNK_SIZE, control=None):
+    """Copia `src` a los destinos con un búfer y pasa cada bloque a `hasher`.
+    
+    Sin destinos solo calcula el hash del original.
+    """
+    src.seek(0)
+    while True:
+        if control:
+            control.checkpoint()
+        data = src.read(chunk_size)
+        if not data:
+            break
+        for dst in dsts:
+            dst.write(data)
+        hasher.update(data)
+        if control and dsts:
+            control.throttle(len(data) * len(dsts))
+    return "búfer+sha256"
+
+
+def file_sha256(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """SHA-256 de un archivo ya escrito."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def drop_cache(fd, offset=0, length=0):
+    """Pide al sistema que saque de su caché un rango de un archivo (todo con `length` 0).
+    
+    Las páginas limpias se descartan en el momento; las que aún no llegaron al
+    disco empiezan a escribirse y se descartan en una llamada posterior. No
+    hace nada donde no existe posix_fadvise.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def set_priority(priority="Normal"):
+    """Baja la prioridad de CPU (nice) y de disco (ionice) del hilo actual.
+    
+    En Linux ambas son por hilo y las heredan los hilos que se creen después,
+    así conviene llamarla desde el hilo que lanza el lote. Devuelve la lista
+    de lo que se pudo aplicar.
+    """
+    values = PRIORITIES.get(priority)
+    if values is None:
+        return []
+    nice, io_class, io_level = values
+    applied = []
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(max(0, nice - os.nice(0)))
+            applied.append(f"nice {nice}")
+        except OSError:
+            pass
+    
+    number = IOPRIO_SET.get(os.uname().machine) if sys.platform.startswith('linux') else None
+    if number is not None:
+        libc = ctypes.CDLL(None, use_errno=True)
+        # IOPRIO_WHO_PROCESS con pid 0: el hilo actual
+        if libc.syscall(number, 1, 0, (io_class << 13) | io_level) == 0:
+            applied.append("ionice " + ("inactiva" if io_class == 3 else f"best-effort {io_level}"))
+    return applied
+
+
+def format_size(size_bytes):
+    """Formatea bytes a unidades legibles."""
+    try:
+        size_bytes = float(size_bytes)
+        if size_bytes >= 1024 * 1024 * 1024:
+            return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
+        elif size_bytes >= 1024 * 1024:
+            return f"{size_bytes / (1024 * 1024):.2f} MB"
+        elif size_bytes >= 1024:
+            return f"{size_bytes / 1024:.2f} KB"
+        else:
+            return f"{size_bytes:.0f} bytes"
+    except:
+        return "0 bytes"
+
+
+def parse_size(value, unit="Bytes"):
+    """Convierte un valor y una unidad (Bytes, KB, MB, GB) a bytes.
+    
+    Si `value` es un texto con la unidad incluida ("1.5MB") se ignora `unit`.
+    Lanza ValueError si el valor no es válido.
+    """
+    text = str(value).strip().upper().replace(" ", "")
+    for suffix in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(suffix) and text[:-len(suffix)]:
+            text, unit = text[:-len(suffix)], suffix
+            break
+    
+    multiplier = UNITS.get(str(unit).upper())
+    if multiplier is None:
+        raise ValueError(f"Unidad desconocida: {unit}")
+    return int(float(text) * multiplier)
+
+
+class ExpansionOptions:
+    """Configuración de una expansión de archivos."""
+    
+    def __init__(self, add_bytes, mode="Agregar", output_folder=None, use_prefix=False,
+                 strategy="Escribir", chunk_size=DEFAULT_CHUNK_SIZE, workers=4, per_device=2,
+                 journal=False, durability="Ninguna", skip_existing=True, padding_check="Ignorar",
+                 targets=None, name_template=DEFAULT_NAME_TEMPLATE, fill="00", manifest=False,
+                 undo=True, max_bytes_per_second=0, max_files_per_second=0, drop_cache=False):
+        self.add_bytes = add_bytes
+        self.mode = mode
+        self.output_folder = output_folder
+        self.use_prefix = use_prefix
+        self.strategy = strategy
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.per_device = per_device
+        self.journal = journal
+        self.durability = durability
+        self.skip_existing = skip_existing
+        self.padding_check = padding_check
+        self.targets = list(targets) if targets and len(targets) > 1 else None
+        self.name_template = name_template
+        self.fill = fill
+        self.manifest = manifest
+        self.undo = undo
+        self.max_bytes_per_second = max_bytes_per_second
+        self.max_files_per_second = max_files_per_second
+        self.drop_cache = drop_cache
+    
+    @property
+    def amounts(self):
+        """Bytes a agregar (o tamaños finales) de cada salida de un archivo."""
+        return self.targets or [self.add_bytes]
+    
+    @property
+    def in_place(self):
+        """Indica si se modifican los archivos originales."""
+        return not self.output_folder and not self.use_prefix and not self.targets
+
+
+def size_label(size_bytes):
+    """Tamaño compacto para nombres de archivo: 16MB, 1.5KB, 100B."""
+    for unit, multiplier in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if size_bytes >= multiplier:
+            return f"{size_bytes / multiplier:.2f}".rstrip("0").rstrip(".") + unit
+    return f"{size_bytes}B"
+
+
+def format_name(template, file_name, amount, index):
+    """Aplica una plantilla de nombre de salida; lanza ValueError si no es válida."""
+    stem, ext = os.path.splitext(file_name)
+    try:
+        return template.format(name=file_name, stem=stem, ext=ext, size=size_label(amount), index=index)
+    except (KeyError, IndexError, AttributeError) as e:
+        raise ValueError(f"plantilla de nombre inválida: {template}") from e
+
+
+def target_size(size, add_bytes, mode):
+    """Tamaño final de un archivo de `size` bytes según el modo.
+    
+    Al alinear, `add_bytes` es el múltiplo; la potencia de 2 no lo usa. Los
+    archivos vacíos siguen vacíos en ambos casos.
+    """
+    if mode == "Agregar":
+        return size + add_bytes
+    if mode == "Alinear a múltiplo":
+        if add_bytes <= 0:
+            raise ValueError("el múltiplo debe ser mayor que 0")
+        return -(-size // add_bytes) * add_bytes
+    if mode == "Siguiente potencia de 2":
+        return 1 << (size - 1).bit_length() if size > 1 else size
+    return max(size, add_bytes)  # Establecer tamaño
+
+
+def trailing_zeros(path, size, limit, chunk_size=DEFAULT_CHUNK_SIZE, value=0):
+    """Cuenta los bytes cero (o iguales a `value`) al final de un archivo, sin pasar de `limit`.
+    
+    Lee hacia atrás desde el final en bloques. Si el final del archivo es un
+    hueco disperso, lo cuenta sin leerlo.
+    """
+    limit = min(limit, size)
+    start = size - limit
+    end = size
+    fill = bytes([value])
+    with open(path, 'rb') as file:
+        if limit and value == 0 and hasattr(os, 'SEEK_HOLE'):
+            fd = file.fileno()
+            hole = size
+            try:
+                hole = os.lseek(fd, start, os.SEEK_HOLE)
+                if hole < size:
+                    os.lseek(fd, hole, os.SEEK_DATA)
+            except OSError as e:
+                # ENXIO: no hay datos después del hueco, llega hasta el final
+                if e.errno == errno.ENXIO:
+                    end = hole
+        
+        count = size - end
+        while end > start:
+            n = min(chunk_size, end - start)
+            file.seek(end - n)
+            chunk = file.read(n)
+            zeros = len(chunk) - len(chunk.rstrip(fill))
+            count += zeros
+            if zeros < n:
+                break
+            end -= n
+    return count
+
+
+def fsync_directory(path):
+    """Hace duradera la entrada de un archivo en su carpeta (no disponible en Windows)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def expand_to_output(input_path, output_path, add_bytes, mode, writer, fsync=False, hasher=None):
+    """Copia un archivo a `output_path` y lo expande de forma atómica.
+    
+    La salida se construye en un temporal de la misma carpeta y se renombra al
+    terminar, así nunca queda un archivo a medias con el nombre final. Con
+    `fsync` los datos y el renombrado se vuelcan a disco antes de volver.
+    Con un StreamHasher se guardan los estados None (original) y `output_path`.
+    """
+    timings = {}
+    mark = time.perf_counter()
+    output_dir = os.path.dirname(output_path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=TEMP_SUFFIX,
+                                     dir=output_dir or None)
+    try:
+        with open(input_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            mark = lap(timings, 'stat', mark)
+            
+            if hasher:
+                copy_method = hashed_copy(src, [dst], hasher, writer.chunk_size, writer.control)
+                hasher.save(None)
+            else:
+                copy_method = copy_file_data(src, dst, size, writer.chunk_size, writer.control)
+            mark = lap(timings, 'copy', mark)
+            
+            pad_bytes = target_size(size, add_bytes, mode) - size
+            strategy, _ = writer.pad(dst, pad_bytes, FillPattern.key(output_path),
+                                     hasher.update if hasher else None)
+            if hasher:
+                hasher.save(output_path)
+            mark = lap(timings, 'pad', mark)
+            
+            if fsync:
+                dst.flush()
+                os.fsync(dst.fileno())
+            if writer.drop_cache:
+                dst.flush()
+                drop_cache(dst.fileno())
+                drop_cache(src.fileno())
+        
+        shutil.copymode(input_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        # No dejar una salida a medias
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    if fsync:
+        fsync_directory(output_dir)
+    lap(timings, 'close', mark)
+    
+    return {'added': pad_bytes, 'strategy': strategy, 'copy': copy_method, 'original': size,
+            'size': size + pad_bytes, 'written': size + pad_bytes, 'timings': timings}
+
+
+def expand_to_outputs(input_path, jobs, writer, fsync=False, hasher=None):
+    """Copia un archivo a varias salidas leyéndolo una sola vez y rellena cada una.
+    
+    `jobs` es una lista de (ruta de salida, bytes, modo). Igual que en
+    expand_to_output, cada salida se construye en un temporal y se renombra al
+    terminar, y con un StreamHasher se guarda un estado por salida.
+    """
+    timings = {}
+    mark = time.perf_counter()
+    temps = []
+    outputs = []
+    try:
+        for output_path, _, _ in jobs:
+            fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=TEMP_SUFFIX,
+                                             dir=os.path.dirname(output_path) or None)
+            temps.append((temp_path, os.fdopen(fd, 'wb')))
+        
+        with open(input_path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            mark = lap(timings, 'stat', mark)
+            dsts = [dst for _, dst in temps]
+            if hasher:
+                copy_method = hashed_copy(src, dsts, hasher, writer.chunk_size, writer.control)
+                hasher.save(None)
+            else:
+                copy_method = fan_out_copy(src, dsts, size, writer.chunk_size, writer.control)
+            if writer.drop_cache:
+                drop_cache(src.fileno())
+            mark = lap(timings, 'copy', mark)
+        
+        for (output_path, add_bytes, mode), (_, dst) in zip(jobs, temps):
+            pad_bytes = target_size(size, add_bytes, mode) - size
+            if hasher:
+                hasher.restore(None)
+            strategy, _ = writer.pad(dst, pad_bytes, FillPattern.key(output_path),
+                                     hasher.update if hasher else None)
+            if hasher:
+                hasher.save(output_path)
+            if fsync:
+                dst.flush()
+                os.fsync(dst.fileno())
+            if writer.drop_cache:
+                dst.flush()
+                drop_cache(dst.fileno())
+            dst.close()
+            outputs.append((output_path, pad_bytes))
+        mark = lap(timings, 'pad', mark)
+        
+        for (output_path, _, _), (temp_path, _) in zip(jobs, temps):
+            shutil.copymode(input_path, temp_path)
+            os.replace(temp_path, output_path)
+    except BaseException:
+        # No dejar salidas a medias
+        for temp_path, dst in temps:
+            dst.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+    
+    if fsync:
+        for folder in {os.path.dirname(output_path) for output_path, _, _ in jobs}:
+            fsync_directory(folder)
+    lap(timings, 'close', mark)
+    
+    added = sum(pad_bytes for _, pad_bytes in outputs)
+    return {'added': added, 'strategy': strategy, 'copy': copy_method, 'original': size,
+            'size': max(size + pad_bytes for _, pad_bytes in outputs),
+            'written': size * len(outputs) + added,
+            'outputs': [output_path for output_path, _ in outputs], 'timings': timings}
+
+
+def expand_in_place(file_path, add_bytes, mode, writer, fsync=False, hasher=None):
+    """Expande un archivo modificando el original.
+    
+    Si algo falla, el archivo se trunca a su longitud original. Con un
+    StreamHasher se lee el original para guardar los estados None y `file_path`.
+    """
+    timings = {}
+    mark = time.perf_counter()
+    with open(file_path, 'ab') as file:
+        size = os.fstat(file.fileno()).st_size
+        mark = lap(timings, 'stat', mark)
+        if hasher:
+            with open(file_path, 'rb') as src:
+                hashed_copy(src, [], hasher, writer.chunk_size, writer.control)
+            hasher.save(None)
+        mark = lap(timings, 'copy', mark)
+        
+        pad_bytes = target_size(size, add_bytes, mode) - size
+        try:
+            strategy, _ = writer.pad(file, pad_bytes, FillPattern.key(file_path),
+                                     hasher.update if hasher else None)
+            if hasher:
+                hasher.save(file_path)
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+            if writer.drop_cache:
+                drop_cache(file.fileno(), size)
+        except BaseException:
+            # Devolver el original a su tamaño
+            try:
+                os.ftruncate(file.fileno(), size)
+            except OSError:
+                pass
+            raise
+        mark = lap(timings, 'pad', mark)
+    lap(timings, 'close', mark)
+    
+    return {'added': pad_bytes, 'strategy': strategy, 'original': size, 'size': size + pad_bytes,
+            'written': pad_bytes, 'timings': timings}
+
+
+def lap(timings, phase, mark):
+    """Anota en `timings` el tiempo de una fase desde `mark` y devuelve el instante actual."""
+    now = time.perf_counter()
+    timings[phase] = now - mark
+    return now
+
+
+def format_duration(seconds):
+    """Formatea segundos como H:MM:SS o MM:SS."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def describe_result(result):
+    """Describe la copia, la estrategia y la velocidad de escritura de un archivo."""
+    trailing = f" | relleno previo al final: {format_size(result['trailing'])}" if result.get('trailing') else ""
+    if result.get('skipped'):
+        return f"omitido: {result['skipped']}{trailing}"
+    text = f"{len(result['outputs'])} salidas | " if 'outputs' in result else ""
+    text += f"copia: {result['copy']} | " if 'copy' in result else ""
+    if not result['added']:
+        return text + "sin relleno" + trailing
+    text += f"{result['strategy']}: {format_size(result['added'])}"
+    seconds = result['timings']['pad']
+    if seconds > 0:
+        text += f" a {format_size(result['added'] / seconds)}/s"
+    return text + trailing
+
+
+def skipped_result(file_path, output_path, size, reason, final=None):
+    """Resultado de un archivo que no hizo falta procesar."""
+    return {'path': file_path, 'output': output_path, 'added': 0, 'strategy': '', 'original': size,
+            'size': size if final is None else final, 'written': 0, 'skipped': reason,
+            'timings': {'stat': 0.0, 'copy': 0.0, 'pad': 0.0, 'close': 0.0}}
+
+
+# Carpeta donde se guardan los diarios de los lotes
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".kiz_space_editor", "journals")
+
+
+class BatchJournal:
+    """Diario en disco de un lote, de solo anexado, para reanudar ejecuciones interrumpidas.
+    
+    Cada línea es un registro JSON: "B" al empezar un archivo, con su tamaño
+    original y el objetivo, y "D" al terminarlo, con el tamaño final y la firma
+    (tamaño y fecha de modificación) del archivo y sus salidas; "X" lo olvida. Cada
+    registro se pasa al sistema operativo en cuanto se escribe, así sobrevive a
+    un cierre o fallo del programa; el fsync se agrupa cada `sync_every`
+    registros o `sync_interval` segundos para no frenar lotes grandes.
+    """
+    
+    def __init__(self, path, sync_every=256, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.states = {}  # ruta -> ('B', original, objetivo) | ('D', final, firmas)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+    
+    @classmethod
+    def for_options(cls, options, inputs=None, folder=JOURNAL_DIR):
+        """Abre el diario que corresponde a unas opciones de expansión.
+        
+        Un mismo modo, tamaño, relleno, destino y conjunto de archivos `inputs`
+        reabren el mismo diario, así al repetir un lote interrumpido se omiten
+        los archivos que ya se completaron.
+        """
+        key = [options.mode, options.add_bytes,
+               os.path.abspath(options.output_folder) if options.output_folder else None,
+               bool(options.use_prefix), options.fill, options.padding_check]
+        if options.targets:
+            key += [options.targets, options.name_template]
+        if inputs is not None:
+            paths = "\n".join(sorted(os.path.abspath(path) for path in inputs))
+            key.append(hashlib.sha1(paths.encode('utf-8', 'surrogateescape')).hexdigest())
+        key = json.dumps(key)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + ".journal"
+        return cls(os.path.join(folder, name))
+    
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Última línea a medias tras un fallo
+                        continue
+                    if record['s'] == 'B':
+                        self.states[record['p']] = ('B', record['o'], record['t'])
+                    elif record['s'] == 'X':
+                        self.states.pop(record['p'], None)
+                    else:
+                        self.states[record['p']] = ('D', record['f'], record.get('m'))
+        except FileNotFoundError:
+            pass
+    
+    def get(self, path):
+        """Estado registrado de un archivo o None."""
+        return self.states.get(path)
+    
+    def completed(self):
+        """Número de archivos completados."""
+        return sum(1 for state in self.states.values() if state[0] == 'D')
+    
+    def unfinished(self):
+        """Número de archivos empezados y no terminados."""
+        return sum(1 for state in self.states.values() if state[0] == 'B')
+    
+    def begin(self, path, original, target):
+        """Registra que se empieza a procesar un archivo."""
+        self.states[path] = ('B', original, target)
+        self._append({'s': 'B', 'p': path, 'o': original, 't': target})
+    
+    def forget(self, path):
+        """Olvida el estado de un archivo, que se tratará como uno nuevo."""
+        if self.states.pop(path, None) is not None:
+            self._append({'s': 'X', 'p': path})
+    
+    def done(self, path, final, files=()):
+        """Registra que un archivo se completó, con la firma actual de `files`."""
+        signatures = self.signatures([path, *files])
+        self.states[path] = ('D', final, signatures)
+        self._append({'s': 'D', 'p': path, 'f': final, 'm': signatures})
+    
+    def finished(self, path):
+        """Tamaño final de un archivo completado, o None si no consta o cambió desde entonces.
+        
+        Solo cuenta como completado si el archivo y sus salidas conservan el
+        tamaño y la fecha de modificación que tenían al terminarlo.
+        """
+        state = self.states.get(path)
+        if not state or state[0] != 'D' or not state[2]:
+            return None
+        if self.signatures(state[2]) != state[2]:
+            return None
+        return state[1]
+    
+    @staticmethod
+    def signatures(paths):
+        """Devuelve {ruta: [tamaño, mtime_ns]} de los archivos que existen."""
+        signatures = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signatures[path] = [st.st_size, st.st_mtime_ns]
+        return signatures
+    
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+    
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+    
+    def close(self, delete=False):
+        """Cierra el diario; con `delete` lo borra porque el lote ya terminó."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._unsynced:
+                self._sync()
+            self._file.close()
+        if delete:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+# Carpeta donde se guardan los manifiestos de tamaños para deshacer lotes
+UNDO_DIR = os.path.join(os.path.expanduser("~"), ".kiz_space_editor", "undo")
+
+
+class SizeManifest:
+    """Manifiesto binario con el tamaño original de cada archivo expandido en su sitio.
+    
+    Empieza con MAGIC y el relleno usado (para poder comprobarlo al deshacer);
+    después, un registro por archivo: tamaño original, tamaño final y largo de
+    la ruta en RECORD, seguidos de la ruta. Ocupa unos 20 bytes más la ruta,
+    así 100.000 archivos se leen de golpe. Cada registro se pasa al sistema
+    operativo al escribirse; si el programa se cierra a medias, el último
+    registro incompleto se descarta al leer.
+    """
+    
+    MAGIC = b"KIZUNDO1"
+    RECORD = struct.Struct('<QQH')
+    
+    def __init__(self, path, fill="00"):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        fill = str(fill).encode('utf-8')
+        self._file.write(self.MAGIC + struct.pack('<H', len(fill)) + fill)
+        self._file.flush()
+    
+    @classmethod
+    def for_run(cls, fill="00", folder=UNDO_DIR):
+        """Crea el manifiesto de una ejecución nueva, con la fecha en el nombre."""
+        os.makedirs(folder, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f"kiz_{time.strftime('%Y%m%d_%H%M%S')}_", suffix=".kizundo",
+                                    dir=folder)
+        os.close(fd)
+        return cls(path, fill)
+    
+    def record(self, path, original, final):
+        """Registra un archivo que pasó de `original` a `final` bytes."""
+        name = os.fsencode(os.path.abspath(path))
+        data = self.RECORD.pack(original, final, len(name)) + name
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            self.count += 1
+    
+    def close(self):
+        """Cierra el manifiesto y lo vuelca a disco; si quedó vacío lo borra."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if self.count:
+                os.fsync(self._file.fileno())
+            self._file.close()
+        if not self.count:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+    
+    @classmethod
+    def read(cls, path):
+        """Lee un manifiesto y devuelve (relleno, [(ruta, original, final)]).
+        
+        Lanza ValueError si el archivo no es un manifiesto de tamaños.
+        """
+        with open(path, 'rb') as file:
+            data = file.read()
+        if not data.startswith(cls.MAGIC) or len(data) < len(cls.MAGIC) + 2:
+            raise ValueError(f"no es un manifiesto de tamaños: {path}")
+        offset = len(cls.MAGIC)
+        (length,) = struct.unpack_from('<H', data, offset)
+        offset += 2
+        fill = data[offset:offset + length].decode('utf-8')
+        offset += length
+        
+        entries = []
+        while offset + cls.RECORD.size <= len(data):
+            original, final, length = cls.RECORD.unpack_from(data, offset)
+            offset += cls.RECORD.size
+            if offset + length > len(data):
+                break
+            entries.append((os.fsdecode(data[offset:offset + length]), original, final))
+            offset += length
+        return fill, entries
+
+
+def padding_matches(path, start, end, fill, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Comprueba que los bytes de `start` a `end` sean el relleno `fill`.
+    
+    Devuelve None si no se puede saber, como con relleno aleatorio.
+    """
+    if fill.random:
+        return None
+    if fill.byte is not None:
+        return trailing_zeros(path, end, end - start, chunk_size, fill.byte) >= end - start
+    
+    # El patrón empieza al principio del relleno, así los bloques coinciden con el buffer
+    buffer = fill.buffer(chunk_size)
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while start < end:
+            n = min(len(buffer), end - start)
+            if file.read(n) != buffer[:n]:
+                return False
+            start += n
+    return True
+
+
+def restore_size(file_path, original, final, fill, chunk_size=DEFAULT_CHUNK_SIZE, verify=True):
+    """Recorta un archivo a su tamaño original si el final sigue siendo el relleno que se agregó.
+    
+    Lanza ValueError si el archivo cambió desde la expansión.
+    """
+    size = os.stat(file_path).st_size
+    result = {'path': file_path, 'original': original, 'size': size, 'removed': 0, 'verified': False}
+    if size == original:
+        result['skipped'] = "ya tiene el tamaño original"
+        return result
+    if size != final:
+        raise ValueError(f"el tamaño cambió desde la expansión ({size:,} bytes, se esperaban {final:,})")
+    if verify and original < final:
+        matches = padding_matches(file_path, original, final, fill, chunk_size)
+        if matches is False:
+            raise ValueError("el final del archivo no es el relleno agregado; no se recorta")
+        result['verified'] = bool(matches)
+    os.truncate(file_path, original)
+    result['size'] = original
+    result['removed'] = final - original
+    return result
+
+
+def restore_sizes(entries, fill="00", workers=8, per_device=8, chunk_size=DEFAULT_CHUNK_SIZE,
+                  verify=True, on_done=None):
+    """Devuelve en paralelo cada archivo de un SizeManifest a su tamaño original.
+    
+    `entries` son los registros de SizeManifest.read(). Devuelve los resultados
+    en el mismo orden, con la excepción en la posición de cada archivo que falló.
+    """
+    fill = parse_fill(fill)
+    executor = BatchExecutor(workers, per_device)
+    return executor.run(entries,
+                        lambda entry: restore_size(entry[0], entry[1], entry[2], fill, chunk_size, verify),
+                        lambda entry: os.stat(entry[0]).st_dev,
+                        on_done)
+
+
+class RunReport:
+    """Métricas de una ejecución: un registro por archivo, velocidad media y ETA.
+    
+    La velocidad se calcula sobre una ventana móvil de `window` segundos, así
+    refleja el ritmo actual y no el promedio desde el inicio.
+    """
+    
+    FIELDS = ['path', 'output', 'status', 'error', 'original_size', 'final_size', 'written',
+              'strategy', 'copy', 'sha256', 'queue_s', 'stat_s', 'copy_s', 'pad_s', 'close_s', 'total_s']
+    
+    def __init__(self, total_files=0, window=5.0):
+        self.total_files = total_files
+        self.window = window
+        self.records = []
+        self.files_done = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self._samples = collections.deque()  # (instante, archivos, bytes)
+        self._lock = threading.Lock()
+    
+    def add(self, path, result):
+        """Anota el resultado de un archivo (dict de Expander.expand o la excepción)."""
+        if isinstance(result, Cancelled):
+            record = {'path': path, 'status': 'cancelled', 'error': str(result), 'written': 0}
+        elif isinstance(result, Exception):
+            record = {'path': path, 'status': 'error', 'error': str(result), 'written': 0}
+        else:
+            timings = result['timings']
+            record = {
+                'path': path,
+                'output': ";".join(result.get('outputs', [result['output']])),
+                'status': 'skipped' if result.get('skipped') else 'ok',
+                'original_size': result['original'],
+                'final_size': result['size'],
+                'written': result['written'],
+                'strategy': result['strategy'],
+                'copy': result.get('copy', ''),
+                'sha256': ";".join(digest for _, _, digest in result.get('digests', [])),
+                'total_s': sum(timings[phase] for phase in ('stat', 'copy', 'pad', 'close'))
+            }
+            for phase, seconds in timings.items():
+                record[f"{phase}_s"] = seconds
+        
+        now = time.perf_counter()
+        with self._lock:
+            self.records.append(record)
+            self.files_done += 1
+            self.bytes_written += record['written']
+            if record['status'] == 'error':
+                self.errors += 1
+            elif record['status'] == 'cancelled':
+                self.cancelled += 1
+            elif record['status'] == 'skipped':
+                self.skipped += 1
+            
+            self._samples.append((now, self.files_done, self.bytes_written))
+            # Conservar una muestra anterior a la ventana como punto de partida
+            while len(self._samples) > 1 and self._samples[1][0] < now - self.window:
+                self._samples.popleft()
+    
+    def finish(self):
+        """Marca el final de la ejecución."""
+        self._end = time.perf_counter()
+    
+    @property
+    def elapsed(self):
+        """Segundos transcurridos desde el inicio."""
+        return (self._end or time.perf_counter()) - self._start
+    
+    def rates(self):
+        """Devuelve (bytes/s, archivos/s) medios en la ventana móvil."""
+        with self._lock:
+            if not self._samples:
+                return 0.0, 0.0
+            if len(self._samples) == 1:
+                first = (self._start, 0, 0)
+            else:
+                first = self._samples[0]
+            last = self._samples[-1]
+        
+        seconds = last[0] - first[0]
+        if seconds <= 0:
+            return 0.0, 0.0
+        return (last[2] - first[2]) / seconds, (last[1] - first[1]) / seconds
+    
+    def eta(self):
+        """Segundos estimados hasta terminar, o None si aún no se puede estimar."""
+        _, files_per_second = self.rates()
+        if not files_per_second:
+            return None
+        return max(0, self.total_files - self.files_done) / files_per_second
+    
+    def progress_text(self):
+        """Texto de progreso con velocidad actual y tiempo restante."""
+        done, total = self.files_done, max(self.total_files, self.files_done)
+        percent = (done / total) * 100 if total else 100.0
+        bytes_per_second, _ = self.rates()
+        eta = self.eta()
+        text = f"⏳ {done}/{total} ({percent:.1f}%) | {format_size(bytes_per_second)}/s"
+        if eta is not None and done < total:
+            text += f" | ETA {format_duration(eta)}"
+        return text
+    
+    def summary(self):
+        """Totales de la ejecución."""
+        elapsed = self.elapsed
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'files': self.files_done,
+            'errors': self.errors,
+            'cancelled': self.cancelled,
+            'skipped': self.skipped,
+            'bytes_written': self.bytes_written,
+            'seconds': elapsed,
+            'bytes_per_second': self.bytes_written / elapsed if elapsed > 0 else 0.0,
+            'files_per_second': self.files_done / elapsed if elapsed > 0 else 0.0
+        }
+    
+    def to_dict(self):
+        """Resumen y registros por archivo, como se guardan en JSON."""
+        with self._lock:
+            records = list(self.records)
+        return {'summary': self.summary(), 'files': records}
+    
+    def export(self, path):
+        """Guarda el informe en JSON o, si la extensión es .csv, en CSV."""
+        if path.lower().endswith('.csv'):
+            with self._lock:
+                records = list(self.records)
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=self.FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(self.to_dict(), file, indent=2, ensure_ascii=False)
+
+
+class Expander:
+    """Expande lotes de archivos según unas ExpansionOptions."""
+    
+    def __init__(self, options, control=None, inputs=None):
+        self.options = options
+        self.control = control or BatchControl()
+        self.fill = parse_fill(options.fill)
+        self.writer = PaddingWriter(options.chunk_size, options.strategy, self.control, self.fill,
+                                    options.drop_cache)
+        if options.max_bytes_per_second or options.max_files_per_second:
+            self.control.limits.set(options.max_bytes_per_second, options.max_files_per_second)
+        self.executor = BatchExecutor(options.workers, options.per_device)
+        self.journal = BatchJournal.for_options(options, inputs) if options.journal else None
+        # Las ejecuciones sobre los originales guardan sus tamaños para poder deshacerlas
+        self.undo = SizeManifest.for_run(self.fill) if options.in_place and options.undo else None
+        self._output_device = None
+    
+    def output_path(self, file_path, index=0):
+        """Devuelve la ruta donde quedará el archivo expandido (la salida `index` con varios tamaños)."""
+        options = self.options
+        filename = os.path.basename(file_path)
+        if options.targets:
+            filename = format_name(options.name_template, filename, options.targets[index], index)
+        output_filename = f"Nuevo_{filename}" if options.use_prefix else filename
+        
+        if options.output_folder:
+            return os.path.join(options.output_folder, output_filename)
+        # Misma carpeta, con o sin prefijo
+        return os.path.join(os.path.dirname(file_path), output_filename)
+    
+    def expand(self, file_path):
+        """Expande un archivo y devuelve un dict con el resultado; lanza la excepción si falla."""
+        options = self.options
+        output_path = file_path if options.in_place else self.output_path(file_path)
+        journal = self.journal
+        self.control.checkpoint()
+        
+        state = journal.get(file_path) if journal else None
+        if state and state[0] == 'D':
+            final = journal.finished(file_path)
+            if final is not None:
+                result = skipped_result(file_path, output_path, final, "ya completado según el diario")
+                return self.hash_existing(result, self.all_outputs(file_path))
+            # Cambió desde que se completó: se procesa como un archivo nuevo
+            state = None
+        
+        self.control.throttle(files=1)
+        st = os.stat(file_path)
+        size = st.st_size
+        # Un archivo empezado y no terminado puede tener relleno a medias:
+        # se vuelve a su tamaño original antes de repetirlo, pero solo si lo
+        # que sobra es relleno nuestro; si no, cambió y se trata como nuevo
+        if state and options.in_place and size > state[1]:
+            if size <= state[2] and padding_matches(file_path, state[1], size, self.fill, options.chunk_size):
+                os.truncate(file_path, state[1])
+                size = state[1]
+            else:
+                journal.forget(file_path)
+        
+        if options.targets:
+            return self.expand_targets(file_path, st, journal)
+        
+        add_bytes, mode, trailing = self.padding_goal(file_path, size)
+        final = target_size(size, add_bytes, mode)
+        reason = self.satisfied(st, size, final, output_path)
+        if reason:
+            result = skipped_result(file_path, output_path, size, reason, size if options.in_place else final)
+            result['trailing'] = trailing
+            return self.hash_existing(result, [output_path])
+        
+        if journal:
+            journal.begin(file_path, size, final)
+        
+        fsync = options.durability == "Por archivo"
+        hasher = self.new_hasher(final) if options.manifest else None
+        try:
+            if options.in_place:
+                result = expand_in_place(file_path, add_bytes, mode, self.writer, fsync, hasher)
+            else:
+                result = expand_to_output(file_path, output_path, add_bytes, mode, self.writer, fsync, hasher)
+            if hasher:
+                digests = hasher.digests()
+                result['input_sha256'] = digests[None]
+                result['digests'] = [(output_path, result['size'], digests[output_path])]
+        finally:
+            if hasher:
+                hasher.close()
+        
+        if journal:
+            journal.done(file_path, result['size'], [output_path])
+        if self.undo and result['size'] != size:
+            self.undo.record(file_path, size, result['size'])
+        
+        result['path'] = file_path
+        result['output'] = output_path
+        result['trailing'] = trailing
+        return result
+    
+    def expand_targets(self, file_path, st, journal):
+        """Genera todas las salidas de un archivo con varios tamaños, leyéndolo una vez."""
+        options = self.options
+        size = st.st_size
+        trailing = self.trailing_zeros(file_path, size, max(options.targets))
+        
+        jobs = []
+        finals = []
+        up_to_date = []
+        for index, amount in enumerate(options.targets):
+            output_path = self.output_path(file_path, index)
+            add_bytes, mode = self.goal(size, amount, trailing)
+            final = target_size(size, add_bytes, mode)
+            finals.append(final)
+            if self.satisfied(st, size, final, output_path):
+                up_to_date.append(output_path)
+            else:
+                jobs.append((output_path, add_bytes, mode))
+        
+        if not jobs:
+            result = skipped_result(file_path, self.output_path(file_path), size,
+                                    "las salidas ya están actualizadas", max(finals))
+            result['trailing'] = trailing
+            return self.hash_existing(result, up_to_date)
+        
+        if journal:
+            journal.begin(file_path, size, max(finals))
+        hasher = self.new_hasher(size * len(jobs) + sum(finals)) if options.manifest else None
+        try:
+            result = expand_to_outputs(file_path, jobs, self.writer, options.durability == "Por archivo", hasher)
+            if hasher:
+                digests = hasher.digests()
+                result['input_sha256'] = digests[None]
+                result['digests'] = [(output_path, os.path.getsize(output_path), digests[output_path])
+                                     for output_path, _, _ in jobs]
+                self.hash_existing(result, up_to_date)
+        finally:
+            if hasher:
+                hasher.close()
+        if journal:
+            journal.done(file_path, result['size'], self.all_outputs(file_path))
+        
+        result['path'] = file_path
+        result['output'] = result['outputs'][0]
+        result['trailing'] = trailing
+        return result
+    
+    def new_hasher(self, total_bytes):
+        """StreamHasher para un archivo; los pequeños se calculan en el mismo hilo."""
+        return StreamHasher(threaded=total_bytes >= HASH_THREAD_MIN)
+    
+    def all_outputs(self, file_path):
+        """Rutas de todas las salidas de un archivo."""
+        if self.options.targets:
+            return [self.output_path(file_path, index) for index in range(len(self.options.targets))]
+        return [file_path if self.options.in_place else self.output_path(file_path)]
+    
+    def hash_existing(self, result, outputs):
+        """Agrega al resultado el SHA-256 de salidas que no se escribieron en esta ejecución.
+        
+        Solo con manifiesto: hay que leerlas, pero el manifiesto queda completo.
+        """
+        if self.options.manifest:
+            digests = result.setdefault('digests', [])
+            for output_path in outputs:
+                if os.path.exists(output_path):
+                    digests.append((output_path, os.path.getsize(output_path),
+                                    file_sha256(output_path, self.options.chunk_size)))
+        return result
+    
+    def padding_goal(self, file_path, size):
+        """Devuelve (bytes, modo, ceros finales) con los que expandir un archivo."""
+        trailing = self.trailing_zeros(file_path, size, self.options.add_bytes)
+        return self.goal(size, self.options.add_bytes, trailing) + (trailing,)
+    
+    def trailing_zeros(self, file_path, size, limit):
+        """Bytes de relleno que el archivo ya tiene al final, si hay que buscarlos.
+        
+        Solo se pueden reconocer los rellenos de un único byte repetido.
+        """
+        options = self.options
+        if options.padding_check == "Ignorar" or options.mode != "Agregar" or self.fill.byte is None:
+            return 0
+        return trailing_zeros(file_path, size, limit, options.chunk_size, self.fill.byte)
+    
+    def goal(self, size, amount, trailing):
+        """Devuelve (bytes, modo) con los que expandir un archivo de `size` bytes.
+        
+        En modo Agregar, "Informar" solo anota los ceros que el archivo ya tiene
+        al final y "Normalizar" los cuenta como relleno de una ejecución
+        anterior, así repetir el lote no vuelve a rellenarlo.
+        """
+        options = self.options
+        if options.padding_check == "Normalizar" and options.mode == "Agregar":
+            return size - min(trailing, amount) + amount, "Establecer tamaño"
+        return amount, options.mode
+    
+    def satisfied(self, st, size, final, output_path):
+        """Motivo por el que no hace falta procesar un archivo, o None."""
+        options = self.options
+        if options.in_place:
+            return "ya tiene el tamaño objetivo" if final <= size else None
+        if not options.skip_existing:
+            return None
+        
+        try:
+            output_st = os.stat(output_path)
+        except FileNotFoundError:
+            return None
+        if os.path.samestat(st, output_st):
+            # La salida es el propio archivo
+            return "ya tiene el tamaño objetivo" if final <= size else None
+        if output_st.st_size == final and output_st.st_mtime_ns >= st.st_mtime_ns:
+            return "la salida ya está actualizada"
+        return None
+    
+    def finish(self, failed=0):
+        """Cierra el diario y el manifiesto de tamaños.
+        
+        El diario se borra si el lote terminó entero, sin archivos pendientes ni errores.
+        """
+        if self.journal:
+            self.journal.close(delete=not failed and not self.control.cancelled
+                               and not self.journal.unfinished())
+        if self.undo:
+            self.undo.close()
+    
+    def device_of(self, file_path):
+        """Dispositivo en el que se escribe el archivo expandido."""
+        if self.options.output_folder:
+            if self._output_device is None:
+                self._output_device = os.stat(self.options.output_folder).st_dev
+            return self._output_device
+        return os.stat(file_path).st_dev
+    
+    def run(self, file_paths, on_done=None, device_of=None, report=None):
+        """Expande los archivos en paralelo y devuelve los resultados en orden.
+        
+        Cada resultado es el dict de expand() o la excepción del archivo que falló.
+        Si se pasa un RunReport, cada resultado se anota en él antes de `on_done`.
+        """
+        submitted = time.perf_counter()
+        
+        def timed_expand(file_path):
+            started = time.perf_counter()
+            result = self.expand(file_path)
+            result['timings']['queue'] = started - submitted
+            return result
+        
+        def file_done(index, result):
+            if report is not None:
+                report.add(file_paths[index], result)
+            if on_done:
+                on_done(index, result)
+        
+        results = self.executor.run(file_paths, timed_expand, device_of or self.device_of, file_done)
+        if self.options.durability == "Por lote":
+            self.sync(result for result in results if not isinstance(result, Exception))
+        return results
+    
+    def sync(self, results):
+        """Vuelca a disco de una vez los archivos escritos en un lote, y solo esos."""
+        outputs = [output for result in results if result['written']
+                   for output in result.get('outputs', [result['output']])]
+        if not outputs:
+            return
+        
+        # os.sync() volcaría todos los discos del equipo, no solo este lote
+        for path in outputs:
+            with open(path, 'rb+') as file:
+                os.fsync(file.fileno())
+        
+        # Los renombrados de las salidas también tienen que llegar al disco
+        if not self.options.in_place:
+            for folder in {os.path.dirname(path) for path in outputs}:
+                fsync_directory(folder)
+
+
+def disk_space(folder):
+    """Devuelve (bytes libres para el usuario, tamaño de bloque) del disco de `folder`."""
+    if hasattr(os, 'statvfs'):
+        st = os.statvfs(folder)
+        return st.f_bavail * st.f_frsize, st.f_frsize or 4096
+    return shutil.disk_usage(folder).free, 4096
+
+
+class BatchPlan:
+    """Bytes que va a copiar y rellenar un lote, agrupados por disco de destino.
+    
+    Se calcula con los tamaños en caché del registro, sin abrir los archivos,
+    para comprobar el espacio libre antes de empezar en vez de fallar a mitad.
+    """
+    
+    def __init__(self):
+        self.files = 0
+        self.copy_bytes = 0
+        self.pad_bytes = 0
+        self.final_bytes = 0
+        self.devices = {}  # st_dev -> {'folder', 'files', 'needed', 'free'}
+    
+    @property
+    def needed(self):
+        """Espacio total que ocupará el lote."""
+        return sum(device['needed'] for device in self.devices.values())
+    
+    @property
+    def shortfalls(self):
+        """Discos sin espacio suficiente."""
+        return [device for device in self.devices.values() if device['needed'] > device['free']]
+    
+    @property
+    def ok(self):
+        """Indica si todos los discos tienen espacio para el lote."""
+        return not self.shortfalls
+    
+    def lines(self):
+        """Resumen del plan en líneas de texto."""
+        lines = [f"Archivos: {self.files} | Copia: {format_size(self.copy_bytes)} | "
+                 f"Relleno: {format_size(self.pad_bytes)} | Tamaño final: {format_size(self.final_bytes)}"]
+        for device in self.devices.values():
+            text = (f"  {device['folder']}: {device['files']} archivos, necesita "
+                    f"{format_size(device['needed'])} de {format_size(device['free'])} libres")
+            if device['needed'] > device['free']:
+                text += f" - faltan {format_size(device['needed'] - device['free'])}"
+            lines.append(text)
+        return lines
+
+
+def plan_batch(options, entries):
+    """Calcula el BatchPlan de expandir los FileEntry de `entries` con unas opciones.
+    
+    El espacio necesario se cuenta en bloques enteros del disco de destino; el
+    relleno disperso no ocupa bloques. Lanza OSError si un destino no existe.
+    """
+    plan = BatchPlan()
+    sparse = options.strategy == "Disperso" and parse_fill(options.fill).zero
+    output_device = os.stat(options.output_folder).st_dev if options.output_folder else None
+    
+    for entry in entries:
+        plan.files += 1
+        
+        # Con carpeta de salida todo va a su disco; si no, al del propio archivo
+        if output_device is None:
+            device_id, folder = entry.dev, os.path.dirname(entry.path) or "."
+        else:
+            device_id, folder = output_device, options.output_folder
+        device = plan.devices.get(device_id)
+        if device is None:
+            free, block = disk_space(folder)
+            device = plan.devices[device_id] = {'folder': folder, 'files': 0, 'needed': 0,
+                                                'free': free, 'block': block}
+        
+        block = device['block']
+        original_blocks = -(-entry.size // block) * block
+        device['files'] += 1
+        # Una salida por cada tamaño pedido
+        for amount in options.amounts:
+            final = target_size(entry.size, amount, options.mode)
+            plan.pad_bytes += final - entry.size
+            plan.final_bytes += final
+            if not options.in_place:
+                plan.copy_bytes += entry.size
+            
+            final_blocks = original_blocks if sparse else -(-final // block) * block
+            device['needed'] += final_blocks - original_blocks if options.in_place else final_blocks
+    
+    return plan
+
+
+def write_manifest(path, results):
+    """Escribe el manifiesto SHA-256 de un lote y devuelve cuántas salidas incluye.
+    
+    Es texto separado por tabuladores, una salida por línea: SHA-256 de la
+    salida, SHA-256 del original (vacío si no se leyó), tamaño original,
+    tamaño final y ruta.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write("# sha256\tsha256_original\ttamaño_original\ttamaño_final\truta\n")
+        for result in results:
+            if isinstance(result, Exception):
+                continue
+            for output_path, final_size, digest in result.get('digests', []):
+                file.write(f"{digest}\t{result.get('input_sha256', '')}\t{result['original']}\t"
+                           f"{final_size}\t{output_path}\n")
+                count += 1
+    return count
+
+
+def collect_files(paths, registry=None):
+    """Agrega al registro los archivos indicados, recorriendo las carpetas."""
+    registry = registry if registry is not None else FileRegistry()
+    for path in paths:
+        if os.path.isdir(path):
+            scanner = FolderScanner(path)
+            scanner.start()
+            for batch in iter(scanner.batches.get, None):
+                for file_path, st in batch:
+                    registry.add(file_path, st)
+        else:
+            registry.add(path)
+    return registry
+
+
+class Inotify:
+    """Eventos de inotify (Linux) leídos con ctypes, sin dependencias externas.
+    
+    Lanza OSError si el sistema no tiene inotify o no quedan vigilancias libres.
+    """
+    
+    # Cambios que pueden dejar un archivo listo o a medio escribir
+    FILE_EVENTS = 0x2 | 0x4 | 0x8 | 0x80 | 0x100  # MODIFY, ATTRIB, CLOSE_WRITE, MOVED_TO, CREATE
+    OVERFLOW = 0x4000
+    IS_DIR = 0x40000000
+    EVENT = struct.Struct('iIII')
+    
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify solo existe en Linux")
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths = {}
+    
+    def add(self, path):
+        """Vigila una carpeta (sin sus subcarpetas)."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.FILE_EVENTS)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self._paths[wd] = path
+    
+    def read(self, timeout):
+        """Espera hasta `timeout` segundos y devuelve [(ruta, máscara)].
+        
+        Si se desbordó la cola del núcleo devuelve [(None, OVERFLOW)]: hay que
+        volver a recorrer la carpeta.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        
+        events = []
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & self.OVERFLOW:
+                events.append((None, mask))
+            elif wd in self._paths and name:
+                events.append((os.path.join(self._paths[wd], os.fsdecode(name)), mask))
+        return events
+    
+    def close(self):
+        """Cierra el descriptor y todas las vigilancias."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FolderWatcher:
+    """Vigila una carpeta y expande los archivos nuevos cuando dejan de cambiar.
+    
+    Usa inotify en Linux y, si no está disponible, recorre la carpeta cada
+    `poll_interval` segundos. Un archivo se considera terminado cuando pasa
+    `quiet` segundos sin cambios; los eventos que llegan mientras tanto solo
+    reinician la espera. Los archivos terminados se agrupan en lotes de hasta
+    `batch_size`, o los que haya `batch_delay` segundos después del primero,
+    y se expanden en otro hilo mientras se sigue vigilando.
+    
+    Se ignoran los temporales, las salidas que genera el propio Expander y los
+    archivos ya procesados que no cambiaron desde entonces (misma ruta, tamaño
+    y fecha). Los archivos que ya estaban al empezar solo se procesan con
+    `existing`.
+    """
+    
+    def __init__(self, folder, expander, quiet=2.0, batch_size=100, batch_delay=0.5, poll_interval=1.0,
+                 recursive=True, existing=False, use_inotify=True, on_done=None, on_batch=None,
+                 report=None):
+        self.folder = os.path.abspath(folder)
+        self.expander = expander
+        self.quiet = quiet
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.poll_interval = poll_interval
+        self.recursive = recursive
+        self.existing = existing
+        self.use_inotify = use_inotify
+        self.on_done = on_done
+        self.on_batch = on_batch
+        self.report = report or RunReport()
+        self.backend = None
+        self.batches = queue.Queue()
+        self.latencies = collections.deque(maxlen=1000)
+        self._candidates = {}  # ruta -> [primera vez, último cambio, (tamaño, mtime) o None]
+        self._ready = []  # [(ruta, primera vez)]
+        self._ready_since = 0.0
+        self._processed = {}  # ruta -> (tamaño, mtime) tras expandirla
+        self._baseline = {}  # ruta -> (tamaño, mtime) del último recorrido completo
+        self._queued = 0
+        self._inotify = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+    
+    def start(self):
+        """Empieza a vigilar y a expandir en segundo plano."""
+        self._baseline = self._scan(self.folder)
+        if self.existing:
+            now = time.monotonic()
+            for path, signature in self._baseline.items():
+                self._touch(path, now, signature)
+        
+        if self.use_inotify and self._open_inotify():
+            self.backend = "inotify"
+            target = self._watch_events
+        else:
+            self.backend = "sondeo"
+            target = self._watch_polling
+        self._threads = [threading.Thread(target=target, daemon=True),
+                         threading.Thread(target=self._expand_batches, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+    
+    def _open_inotify(self):
+        """Intenta vigilar con inotify la carpeta y sus subcarpetas; devuelve False si no se puede."""
+        try:
+            self._inotify = Inotify()
+            self._add_watches(self.folder)
+            return True
+        except OSError:
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+            return False
+    
+    def stop(self, cancel=False):
+        """Deja de vigilar; termina los lotes ya en cola o, con `cancel`, los cancela."""
+        self._stop.set()
+        if cancel:
+            self.expander.control.cancel()
+    
+    def join(self, timeout=None):
+        """Espera a que los hilos terminen; devuelve True si terminaron."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+    
+    def stats(self):
+        """Métricas actuales: archivos pendientes y en cola, y latencia desde que llegan hasta expandirse."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {'backend': self.backend,
+                     'pending': len(self._candidates),
+                     'queued': self._queued,
+                     'processed': self.report.files_done,
+                     'errors': self.report.errors}
+        for name, fraction in (('latency_p50', 0.50), ('latency_p99', 0.99)):
+            stats[name] = latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+        stats['latency_max'] = latencies[-1] if latencies else 0.0
+        return stats
+    
+    def _scan(self, folder):
+        """Devuelve {ruta: (tamaño, mtime)} de los archivos de una carpeta."""
+        files = {}
+        pending_dirs = [folder]
+        while pending_dirs:
+            try:
+                with os.scandir(pending_dirs.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.recursive:
+                                    pending_dirs.append(entry.path)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                files[entry.path] = (st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return files
+    
+    def _add_watches(self, folder):
+        self._inotify.add(folder)
+        if self.recursive:
+            for root, dirs, _ in os.walk(folder):
+                for name in dirs:
+                    self._inotify.add(os.path.join(root, name))
+    
+    def _touch(self, path, now, signature=None):
+        """Anota un cambio en un archivo; reinicia su espera."""
+        if path.endswith(TEMP_SUFFIX):
+            return
+        candidate = self._candidates.get(path)
+        if candidate is None:
+            self._candidates[path] = [now, now, signature]
+        else:
+            candidate[1] = now
+            candidate[2] = signature
+    
+    def _watch_events(self):
+        tick = min(0.25, self.quiet / 4)
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                for path, mask in self._inotify.read(tick):
+                    if path is None:
+                        # Se perdieron eventos: se revisa solo lo que cambió desde el último recorrido
+                        self._touch_changed(now)
+                    elif mask & Inotify.IS_DIR:
+                        if self.recursive:
+                            self._watch_new_folder(path, now)
+                    else:
+                        self._touch(path, now)
+                self._check(time.monotonic())
+        finally:
+            self._inotify.close()
+            self._flush()
+            self.batches.put(None)
+    
+    def _watch_new_folder(self, path, now):
+        """Vigila una subcarpeta nueva y revisa lo que se escribió antes de vigilarla."""
+        try:
+            self._add_watches(path)
+        except OSError:
+            return
+        for file_path, signature in self._scan(path).items():
+            self._touch(file_path, now, signature)
+    
+    def _watch_polling(self):
+        try:
+            while not self._stop.wait(min(self.poll_interval, self.quiet / 2)):
+                now = time.monotonic()
+                self._touch_changed(now)
+                self._check(now)
+        finally:
+            self._flush()
+            self.batches.put(None)
+    
+    def _touch_changed(self, now):
+        """Recorre la carpeta y anota los archivos distintos del recorrido anterior."""
+        current = self._scan(self.folder)
+        for path, signature in current.items():
+            if self._baseline.get(path) != signature:
+                self._touch(path, now, signature)
+        self._baseline = current
+    
+    def _check(self, now):
+        """Pasa a la cola los archivos que llevan `quiet` segundos sin cambios."""
+        for path, candidate in list(self._candidates.items()):
+            first_seen, last_change, signature = candidate
+            if now - last_change < self.quiet:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._candidates[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            # Con sondeo el cambio puede haber pasado entre dos recorridos
+            if signature is not None and current != signature:
+                candidate[1:] = [now, current]
+                continue
+            del self._candidates[path]
+            with self._lock:
+                if self._processed.get(path) == current:
+                    continue
+                self._queued += 1
+            if not self._ready:
+                self._ready_since = now
+            self._ready.append((path, first_seen))
+        
+        if self._ready and (len(self._ready) >= self.batch_size or now - self._ready_since >= self.batch_delay):
+            self._flush()
+    
+    def _flush(self):
+        """Pasa los archivos listos a la cola del hilo que expande, en lotes de `batch_size`."""
+        for start in range(0, len(self._ready), self.batch_size):
+            self.batches.put(self._ready[start:start + self.batch_size])
+        self._ready = []
+    
+    def _remember(self, paths):
+        """Guarda la firma de archivos escritos por el propio Expander para no volver a procesarlos."""
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                self._processed[path] = (st.st_size, st.st_mtime_ns)
+    
+    def _expand_batches(self):
+        for batch in iter(self.batches.get, None):
+            if self.expander.control.cancelled:
+                break
+            file_paths = [path for path, _ in batch]
+            first_seen = dict(batch)
+            self.report.total_files += len(file_paths)
+            
+            def file_done(index, result):
+                path = file_paths[index]
+                if not isinstance(result, Exception):
+                    self._remember([path] + result.get('outputs', [result['output']]))
+                with self._lock:
+                    self._queued -= 1
+                    self.latencies.append(time.monotonic() - first_seen[path])
+                if self.on_done:
+                    self.on_done(path, result)
+            
+            results = self.expander.run(file_paths, file_done, report=self.report)
+            if self.on_batch:
+                self.on_batch(file_paths, results)
+
+
+CLI_MODES = {"agregar": "Agregar", "establecer": "Establecer tamaño", "alinear": "Alinear a múltiplo",
+             "potencia": "Siguiente potencia de 2"}
+CLI_STRATEGIES = {"escribir": "Escribir", "disperso": "Disperso", "preasignado": "Preasignado"}
+CLI_DURABILITY = {"ninguna": "Ninguna", "archivo": "Por archivo", "lote": "Por lote"}
+CLI_PADDING_CHECKS = {"ignorar": "Ignorar", "informar": "Informar", "normalizar": "Normalizar"}
+CLI_PRIORITIES = {"normal": "Normal", "baja": "Baja", "inactiva": "Inactiva"}
+
+
+def build_parser():
+    """Crea el analizador de argumentos de la línea de comandos."""
+    parser = argparse.ArgumentParser(
+        prog="kiz_engine",
+        description="Añade relleno al final de archivos sin abrir la interfaz gráfica.")
+    parser.add_argument("paths", nargs="*", help="archivos o carpetas a expandir")
+    parser.add_argument("-s", "--size",
+                        help="tamaño a agregar, tamaño final o múltiplo al que alinear, p. ej. 512, 100KB, "
+                             "1.5MB; varios separados por comas (1MB,16MB,64MB) generan una salida de cada "
+                             "tamaño. No hace falta con --mode potencia")
+    parser.add_argument("-m", "--mode", choices=CLI_MODES, default="agregar",
+                        help="agregar el tamaño, establecer el tamaño final, alinear a un múltiplo del "
+                             "tamaño o llevar a la siguiente potencia de 2 (por defecto: agregar)")
+    parser.add_argument("-o", "--output", metavar="CARPETA",
+                        help="guardar los archivos expandidos en esta carpeta")
+    parser.add_argument("-p", "--prefix", action="store_true",
+                        help='agregar el prefijo "Nuevo_" a los nombres')
+    parser.add_argument("--name", default=DEFAULT_NAME_TEMPLATE, metavar="PLANTILLA",
+                        help="nombre de cada salida con varios tamaños; campos {name}, {stem}, {ext}, "
+                             "{size} e {index} (por defecto: %(default)s)")
+    parser.add_argument("--strategy", choices=CLI_STRATEGIES, default="escribir",
+                        help="cómo se escribe el relleno (por defecto: escribir)")
+    parser.add_argument("--fill", default="00", metavar="PATRÓN",
+                        help="relleno: bytes en hexadecimal (00, FF, 20, DEADBEEF) o aleatorio[:SEMILLA] "
+                             "(por defecto: 00)")
+    parser.add_argument("--chunk-size", default="1MB",
+                        help="tamaño del bloque de escritura (por defecto: 1MB)")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="hilos de trabajo (por defecto: 4)")
+    parser.add_argument("--per-device", type=int, default=2,
+                        help="hilos máximos por disco (por defecto: 2)")
+    parser.add_argument("--limit-rate", default="0", metavar="TAMAÑO",
+                        help="bytes escritos por segundo como máximo, p. ej. 50MB; SIGUSR1 lo reduce a la "
+                             "mitad y SIGUSR2 lo duplica durante la ejecución (por defecto: sin límite)")
+    parser.add_argument("--limit-files", type=float, default=0, metavar="N",
+                        help="archivos abiertos por segundo como máximo (por defecto: sin límite)")
+    parser.add_argument("--priority", choices=CLI_PRIORITIES, default="normal",
+                        help="prioridad de CPU y disco frente a otros procesos (por defecto: normal)")
+    parser.add_argument("--drop-cache", action="store_true",
+                        help="no dejar lo escrito en la caché del sistema (posix_fadvise DONTNEED)")
+    parser.add_argument("--durability", choices=CLI_DURABILITY, default="ninguna",
+                        help="fsync de cada archivo, un volcado por lote o ninguno (por defecto: ninguna)")
+    parser.add_argument("--padding", choices=CLI_PADDING_CHECKS, default="ignorar",
+                        help="en modo agregar, informar de los ceros que ya hay al final o contarlos "
+                             "como relleno previo (por defecto: ignorar)")
+    parser.add_argument("--overwrite", dest="skip_existing", action="store_false",
+                        help="rehacer las salidas aunque ya estén actualizadas")
+    parser.add_argument("--no-journal", dest="journal", action="store_false",
+                        help="no usar el diario para reanudar lotes interrumpidos")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="solo mostrar lo que se copiaría y rellenaría y el espacio necesario")
+    parser.add_argument("--force", action="store_true",
+                        help="procesar aunque el espacio libre no parezca suficiente; con --restore, "
+                             "recortar sin comprobar que el final sea relleno")
+    parser.add_argument("--watch", action="store_true",
+                        help="vigilar la carpeta y expandir cada archivo nuevo cuando deja de cambiar")
+    parser.add_argument("--stable", type=float, default=2.0, metavar="SEGUNDOS",
+                        help="con --watch, segundos sin cambios para dar un archivo por terminado "
+                             "(por defecto: 2)")
+    parser.add_argument("--existing", action="store_true",
+                        help="con --watch, procesar también los archivos que ya están en la carpeta")
+    parser.add_argument("--poll", action="store_true",
+                        help="con --watch, recorrer la carpeta periódicamente en lugar de usar inotify")
+    parser.add_argument("--no-undo", dest="undo", action="store_false",
+                        help="no guardar los tamaños originales al expandir en el sitio")
+    parser.add_argument("--restore", metavar="MANIFIESTO",
+                        help="deshacer una ejecución: devolver los archivos de un manifiesto .kizundo "
+                             "a su tamaño original")
+    parser.add_argument("--manifest", metavar="ARCHIVO",
+                        help="guardar el SHA-256 de cada salida, calculado mientras se escribe")
+    parser.add_argument("--report", metavar="ARCHIVO",
+                        help="guardar las métricas por archivo en JSON o CSV (según la extensión)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="mostrar solo el resumen")
+    return parser
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos; devuelve el código de salida."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    
+    if args.restore:
+        return restore_main(args)
+    if not args.paths:
+        parser.error("faltan los archivos o carpetas a expandir")
+    if args.size is None:
+        if args.mode != "potencia":
+            parser.error("falta el tamaño (--size)")
+        args.size = "1"
+    try:
+        sizes = [parse_size(size) for size in args.size.split(",") if size.strip()]
+        chunk_size = parse_size(args.chunk_size)
+        limit_rate = parse_size(args.limit_rate)
+    except ValueError as e:
+        parser.error(f"tamaño inválido: {e}")
+    if limit_rate < 0 or args.limit_files < 0:
+        parser.error("los límites no pueden ser negativos")
+    if not sizes or min(sizes) <= 0 or chunk_size <= 0:
+        parser.error("el tamaño debe ser mayor que 0")
+    try:
+        parse_fill(args.fill)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        names = {format_name(args.name, "archivo.bin", size, index) for index, size in enumerate(sizes)}
+    except ValueError as e:
+        parser.error(str(e))
+    if len(sizes) > 1 and len(names) < len(sizes):
+        parser.error("la plantilla de nombre debe distinguir cada tamaño, p. ej. con {size} o {index}")
+    if args.output and not os.path.isdir(args.output):
+        parser.error(f"la carpeta de salida no existe: {args.output}")
+    if args.watch:
+        if len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+            parser.error("--watch necesita una sola carpeta")
+        if args.dry_run:
+            parser.error("--watch no admite --dry-run")
+        if args.stable <= 0:
+            parser.error("--stable debe ser mayor que 0")
+    
+    options = ExpansionOptions(sizes[0],
+                               mode=CLI_MODES[args.mode],
+                               output_folder=args.output,
+                               use_prefix=args.prefix,
+                               strategy=CLI_STRATEGIES[args.strategy],
+                               chunk_size=chunk_size,
+                               workers=args.workers,
+                               per_device=args.per_device,
+                               journal=args.journal,
+                               durability=CLI_DURABILITY[args.durability],
+                               skip_existing=args.skip_existing,
+                               padding_check=CLI_PADDING_CHECKS[args.padding],
+                               targets=sizes,
+                               name_template=args.name,
+                               fill=args.fill,
+                               manifest=bool(args.manifest),
+                               undo=args.undo,
+                               max_bytes_per_second=limit_rate,
+                               max_files_per_second=args.limit_files,
+                               drop_cache=args.drop_cache)
+    for applied in set_priority(CLI_PRIORITIES[args.priority]):
+        print(f"Prioridad: {applied}")
+    if args.watch:
+        return watch_main(args, options)
+    
+    registry = collect_files(args.paths)
+    file_paths = list(registry)
+    if not file_paths:
+        print("No hay archivos para procesar", file=sys.stderr)
+        return 1
+    
+    # Comprobar el espacio antes de empezar para no fallar a mitad del lote
+    try:
+        plan = plan_batch(options, registry.entries())
+    except OSError as e:
+        print(f"No se pudo comprobar el espacio libre: {e}", file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print("\n".join(plan.lines()))
+        return 0 if plan.ok else 1
+    if not plan.ok and not args.force:
+        print("Espacio libre insuficiente:", file=sys.stderr)
+        print("\n".join(plan.lines()), file=sys.stderr)
+        return 1
+    
+    expander = Expander(options, inputs=file_paths)
+    if expander.journal and expander.journal.completed():
+        print(f"Reanudando lote: {expander.journal.completed()} archivos ya completados se omitirán")
+    print_lock = threading.Lock()
+    
+    def file_done(index, result):
+        if args.quiet:
+            return
+        with print_lock:
+            if isinstance(result, Cancelled):
+                return
+            if isinstance(result, Exception):
+                print(f"ERROR {file_paths[index]}: {result}", file=sys.stderr)
+            else:
+                outputs = ", ".join(result.get('outputs', [result['output']]))
+                print(f"OK    {outputs} ({describe_result(result)})")
+    
+    # Sin carpeta de salida, el disco de cada archivo ya está en la caché del registro
+    if options.output_folder:
+        device_of = expander.device_of
+    else:
+        device_of = lambda file_path: registry.get(file_path).dev
+    
+    # Ctrl+C cancela entre bloques y deja cada archivo intacto o completo
+    def interrupt(signum, frame):
+        if not expander.control.cancelled:
+            print("Cancelando...", file=sys.stderr)
+        expander.control.cancel()
+    
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    report = RunReport(len(file_paths))
+    rate_handlers = install_rate_signals(expander.control, report)
+    try:
+        results = expander.run(file_paths, file_done, device_of, report)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        restore_signals(rate_handlers)
+    report.finish()
+    expander.finish(report.errors + report.cancelled)
+    
+    added = sum(result['added'] for result in results if not isinstance(result, Exception))
+    summary = report.summary()
+    correct = summary['files'] - summary['errors'] - summary['cancelled'] - summary['skipped']
+    print(f"Procesados: {correct} correctos, {summary['skipped']} omitidos, {summary['errors']} con error | "
+          f"Total expandido: {format_size(added)} en {summary['seconds']:.2f} s "
+          f"({format_size(summary['bytes_per_second'])}/s)")
+    
+    if expander.undo and expander.undo.count:
+        print(f"Para deshacerlo: kiz_engine --restore {expander.undo.path}")
+    
+    if args.manifest:
+        try:
+            write_manifest(args.manifest, results)
+        except OSError as e:
+            print(f"No se pudo guardar el manifiesto: {e}", file=sys.stderr)
+            return 1
+    if args.report:
+        try:
+            report.export(args.report)
+        except OSError as e:
+            print(f"No se pudo guardar el informe: {e}", file=sys.stderr)
+            return 1
+    if summary['cancelled']:
+        print(f"Cancelado: {summary['cancelled']} archivos sin procesar", file=sys.stderr)
+        return 130
+    return 1 if summary['errors'] else 0
+
+
+def install_rate_signals(control, report):
+    """SIGUSR1 reduce a la mitad el límite de bytes por segundo y SIGUSR2 lo duplica.
+    
+    Sin límite, SIGUSR1 empieza por la mitad de la velocidad actual. Devuelve
+    los manejadores anteriores para restore_signals().
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return {}
+    
+    def change_rate(signum, frame):
+        limits = control.limits
+        rate = limits.bytes.rate
+        if signum == signal.SIGUSR1:
+            rate = (rate or report.rates()[0] or DEFAULT_CHUNK_SIZE) / 2
+        elif rate:
+            rate *= 2
+        limits.set(bytes_per_second=int(rate))
+        print(f"Límite: {limits.describe()}", file=sys.stderr, flush=True)
+    
+    return {signum: signal.signal(signum, change_rate) for signum in (signal.SIGUSR1, signal.SIGUSR2)}
+
+
+def restore_signals(handlers):
+    """Vuelve a poner los manejadores de señales guardados."""
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def watch_main(args, options):
+    """Vigila una carpeta y expande los archivos que van llegando hasta Ctrl+C (--watch)."""
+    expander = Expander(options)
+    report = RunReport()
+    all_results = []
+    print_lock = threading.Lock()
+    
+    def file_done(path, result):
+        if args.quiet:
+            return
+        with print_lock:
+            if isinstance(result, Cancelled):
+                return
+            if isinstance(result, Exception):
+                print(f"ERROR {path}: {result}", file=sys.stderr)
+            else:
+                outputs = ", ".join(result.get('outputs', [result['output']]))
+                print(f"OK    {outputs} ({describe_result(result)})", flush=True)
+    
+    def batch_done(file_paths, results):
+        all_results.extend(results)
+        if args.quiet:
+            return
+        stats = watcher.stats()
+        with print_lock:
+            print(f"Lote de {len(file_paths)} | en espera: {stats['pending']} | en cola: {stats['queued']} | "
+                  f"latencia p50 {stats['latency_p50']:.2f} s, p99 {stats['latency_p99']:.2f} s", flush=True)
+    
+    watcher = FolderWatcher(args.paths[0], expander, quiet=args.stable, existing=args.existing,
+                            use_inotify=not args.poll, on_done=file_done, on_batch=batch_done, report=report)
+    
+    # Ctrl+C o SIGTERM terminan la vigilancia y cancelan el lote en curso entre bloques
+    def interrupt(signum, frame):
+        if not expander.control.cancelled:
+            print("Terminando...", file=sys.stderr)
+        watcher.stop(cancel=True)
+    
+    previous_handlers = {signum: signal.signal(signum, interrupt) for signum in (signal.SIGINT, signal.SIGTERM)}
+    previous_handlers.update(install_rate_signals(expander.control, report))
+    try:
+        watcher.start()
+        print(f"Vigilando {watcher.folder} con {watcher.backend} (Ctrl+C para terminar)", flush=True)
+        while not watcher.join(0.5):
+            pass
+    finally:
+        restore_signals(previous_handlers)
+    report.finish()
+    expander.finish(report.errors + report.cancelled)
+    
+    summary = report.summary()
+    correct = summary['files'] - summary['errors'] - summary['cancelled'] - summary['skipped']
+    print(f"Procesados: {correct} correctos, {summary['skipped']} omitidos, {summary['errors']} con error | "
+          f"Escrito: {format_size(summary['bytes_written'])} en {format_duration(summary['seconds'])}")
+    if expander.undo and expander.undo.count:
+        print(f"Para deshacerlo: kiz_engine --restore {expander.undo.path}")
+    
+    try:
+        if args.manifest:
+            write_manifest(args.manifest, all_results)
+        if args.report:
+            report.export(args.report)
+    except OSError as e:
+        print(f"No se pudo guardar el manifiesto o el informe: {e}", file=sys.stderr)
+        return 1
+    return 1 if summary['errors'] else 0
+
+
+def restore_main(args):
+    """Devuelve a su tamaño original los archivos de un manifiesto de tamaños (--restore)."""
+    try:
+        fill, entries = SizeManifest.read(args.restore)
+    except (OSError, ValueError) as e:
+        print(f"No se pudo leer el manifiesto: {e}", file=sys.stderr)
+        return 1
+    
+    print_lock = threading.Lock()
+    
+    def file_done(index, result):
+        if args.quiet:
+            return
+        with print_lock:
+            if isinstance(result, Exception):
+                print(f"ERROR {entries[index][0]}: {result}", file=sys.stderr)
+            elif result.get('skipped'):
+                print(f"OMITIDO {result['path']} ({result['skipped']})")
+            else:
+                print(f"OK    {result['path']} (-{format_size(result['removed'])})")
+    
+    start = time.perf_counter()
+    results = restore_sizes(entries, fill, args.workers, args.per_device, verify=not args.force,
+                            on_done=file_done)
+    elapsed = time.perf_counter() - start
+    
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    skipped = sum(1 for result in results if not isinstance(result, Exception) and result.get('skipped'))
+    removed = sum(result['removed'] for result in results if not isinstance(result, Exception))
+    print(f"Restaurados: {len(results) - errors - skipped} correctos, {skipped} omitidos, {errors} con error | "
+          f"Total recortado: {format_size(removed)} en {elapsed:.2f} s")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+"""Servidor local de trabajos de Kiz Space Editor.
+
+Permite que varias herramientas de la misma máquina envíen lotes de expansión
+a un único proceso, con una API HTTP/JSON que solo escucha en 127.0.0.1:
+
+    python kiz_server.py --port 8765 --workers 4
+
+    POST   /jobs               envía un trabajo y devuelve su id
+    GET    /jobs               estado de todos los trabajos
+    GET    /jobs/ID            estado y progreso de un trabajo
+    POST   /jobs/ID/cancel     cancela un trabajo (también DELETE /jobs/ID)
+    GET    /jobs/ID/report     informe por archivo, como --report del motor
+    GET    /limits             límites de ritmo compartidos por todos los trabajos
+    POST   /limits             los cambia en marcha: {"bytes_per_second": 50000000}
+
+Las peticiones POST y DELETE deben llevar "Content-Type: application/json",
+no llevar cabecera Origin y venir dirigidas a 127.0.0.1 o localhost con el
+puerto del servidor; así una página web abierta en el navegador no puede
+enviar ni cancelar trabajos.
+
+El cuerpo de POST /jobs es un objeto JSON con las mismas opciones que la línea
+de comandos del motor, por ejemplo:
+
+    {"paths": ["/datos/entrada"], "size": "1MB", "mode": "agregar",
+     "output": "/datos/salida", "prefix": false}
+
+Todos los trabajos comparten un pool de hilos con un límite por disco. Los
+archivos se reparten por turnos entre los trabajos activos, así un lote
+grande no retrasa a los que llegan después.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kiz_engine import (MODES, PADDING_STRATEGIES, DURABILITY, PADDING_CHECKS, DEFAULT_CHUNK_SIZE,
+                        DEFAULT_NAME_TEMPLATE, CLI_MODES, CLI_STRATEGIES, CLI_DURABILITY, CLI_PADDING_CHECKS,
+                        CLI_PRIORITIES, ExpansionOptions, Expander, BatchControl, Cancelled, RateLimits,
+                        RunReport, collect_files, format_name, format_size, parse_fill, parse_size, plan_batch, set_priority)
+
+DEFAULT_PORT = 8765
+
+# Bloque de escritura máximo que puede pedir un cliente: el relleno se arma en memoria
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class Job:
+    """Un lote enviado al servidor: sus opciones, los archivos pendientes y su informe."""
+
+    def __init__(self, job_id, options, file_paths, device_of=None, limits=None):
+        self.id = job_id
+        self.options = options
+        self.expander = Expander(options, BatchControl(limits))
+        # Por defecto, el disco donde se escribe: el de la carpeta de salida si la hay
+        device_of = device_of or self.expander.device_of
+        self.pending = collections.deque()
+        for file_path in file_paths:
+            try:
+                device = device_of(file_path)
+            except OSError:
+                device = None
+            self.pending.append((file_path, device))
+        self.total = len(file_paths)
+        self.running = 0
+        self.results = []
+        self.report = RunReport(len(file_paths))
+        self.state = "queued"
+        self.closing = False
+        self.submitted = time.perf_counter()
+        self.created_at = time.time()
+
+    def status(self):
+        """Estado del trabajo para la API."""
+        bytes_per_second, files_per_second = self.report.rates()
+        status = {
+            'id': self.id,
+            'state': self.state,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.created_at)),
+            'total': self.total,
+            'done': self.report.files_done,
+            'pending': len(self.pending),
+            'running': self.running,
+            'errors': self.report.errors,
+            'skipped': self.report.skipped,
+            'cancelled': self.report.cancelled,
+            'bytes_written': self.report.bytes_written,
+            'bytes_per_second': bytes_per_second,
+            'files_per_second': files_per_second,
+            'eta_s': self.report.eta() if self.state == "running" else None
+        }
+        if self.expander.undo and self.expander.undo.count:
+            status['undo'] = self.expander.undo.path
+        return status
+
+
+class JobScheduler:
+    """Pool de hilos compartido por todos los trabajos, con turnos justos entre ellos.
+
+    Cada hilo toma el siguiente archivo del siguiente trabajo activo en orden
+    circular, saltando los trabajos cuyo próximo archivo está en un disco que
+    ya tiene `per_device` archivos en curso. Los trabajos terminados se
+    conservan hasta que hay más de `keep`. Todos los trabajos comparten los
+    mismos RateLimits.
+    """
+
+    def __init__(self, workers=4, per_device=2, keep=100, limits=None):
+        self.workers = max(1, int(workers))
+        self.per_device = max(1, int(per_device))
+        self.keep = keep
+        self.limits = limits or RateLimits()
+        self.jobs = collections.OrderedDict()
+        self._active = collections.deque()
+        self._busy = collections.Counter()
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, options, file_paths, device_of=None):
+        """Crea un trabajo y lo pone en la ronda; lanza OSError si no se puede preparar."""
+        with self._cond:
+            job_id = str(next(self._ids))
+        job = Job(job_id, options, file_paths, device_of, self.limits)
+        with self._cond:
+            self.jobs[job_id] = job
+            closing = False
+            if job.pending:
+                self._active.append(job)
+            else:
+                closing = self._closing(job)
+            self._cond.notify_all()
+        if closing:
+            self._finish(job)
+        return job
+
+    def get(self, job_id):
+        """Devuelve un trabajo o None."""
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """Todos los trabajos conservados, del más antiguo al más nuevo."""
+        with self._cond:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """Cancela un trabajo; los archivos en curso quedan intactos o completos."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.closing:
+                return job
+            job.expander.control.cancel()
+            while job.pending:
+                file_path, _ = job.pending.popleft()
+                job.report.add(file_path, Cancelled("trabajo cancelado"))
+            # Sin pendientes sale de la ronda aunque le queden archivos en curso
+            if job in self._active:
+                self._active.remove(job)
+            closing = self._closing(job)
+            self._cond.notify_all()
+        if closing:
+            self._finish(job)
+        return job
+
+    def close(self):
+        """Cancela todos los trabajos y detiene los hilos."""
+        for job in self.list():
+            self.cancel(job.id)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self):
+        """Siguiente (trabajo, archivo, disco) por turnos, o None si no hay nada que se pueda empezar."""
+        for _ in range(len(self._active)):
+            job = self._active[0]
+            self._active.rotate(-1)
+            if not job.pending:
+                continue
+            file_path, device = job.pending[0]
+            if self._busy[device] < self.per_device:
+                job.pending.popleft()
+                job.running += 1
+                job.state = "running"
+                self._busy[device] += 1
+                if not job.pending:
+                    self._active.remove(job)
+                return job, file_path, device
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                item = self._next()
+                while item is None and not self._stopping:
+                    self._cond.wait()
+                    item = self._next()
+                if item is None:
+                    return
+
+            job, file_path, device = item
+            started = time.perf_counter()
+            try:
+                result = job.expander.expand(file_path)
+                result['timings']['queue'] = started - job.submitted
+            except Exception as e:
+                result = e
+            job.report.add(file_path, result)
+
+            with self._cond:
+                self._busy[device] -= 1
+                job.running -= 1
+                if not isinstance(result, Exception):
+                    job.results.append(result)
+                closing = self._closing(job)
+                self._cond.notify_all()
+            if closing:
+                self._finish(job)
+
+    def _closing(self, job):
+        """Indica si quien llama debe cerrar el trabajo con _finish (con el lock tomado).
+
+        Solo devuelve True una vez, cuando ya no quedan archivos pendientes ni en curso.
+        """
+        if job.pending or job.running or job.closing:
+            return False
+        job.closing = True
+        if job in self._active:
+            self._active.remove(job)
+        return True
+
+    def _finish(self, job):
+        """Cierra un trabajo; el volcado a disco se hace sin el lock para no frenar a los demás."""
+        job.report.finish()
+        if job.options.durability == "Por lote":
+            try:
+                job.expander.sync(job.results)
+            except OSError:
+                pass
+        job.expander.finish(job.report.errors + job.report.cancelled)
+
+        with self._cond:
+            job.state = "cancelled" if job.expander.control.cancelled else "done"
+            finished = [old for old in self.jobs.values() if old.state in ("done", "cancelled")]
+            for old in finished[:max(0, len(finished) - self.keep)]:
+                del self.jobs[old.id]
+
+
+def choice(value, cli_names, names, field):
+    """Acepta el nombre de la línea de comandos ("agregar") o el de la interfaz ("Agregar")."""
+    value = cli_names.get(str(value).lower(), value)
+    if value not in names:
+        raise ValueError(f"{field} desconocido: {value}")
+    return value
+
+
+def options_from_request(data):
+    """Convierte el JSON de POST /jobs en (ExpansionOptions, rutas); lanza ValueError si no es válido."""
+    if not isinstance(data, dict):
+        raise ValueError("el cuerpo debe ser un objeto JSON")
+    paths = data.get('paths')
+    if isinstance(paths, str):
+        paths = [paths]
+    if not paths or not all(isinstance(path, str) for path in paths):
+        raise ValueError("faltan las rutas (paths)")
+
+    mode = choice(data.get('mode', "agregar"), CLI_MODES, MODES, "modo")
+    size = data.get('size', "1" if mode == "Siguiente potencia de 2" else None)
+    if size is None:
+        raise ValueError("falta el tamaño (size)")
+    values = size if isinstance(size, (list, tuple)) else str(size).split(",")
+    try:
+        sizes = [parse_size(value) for value in values if str(value).strip()]
+        chunk_size = parse_size(data.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except ValueError as e:
+        raise ValueError(f"tamaño inválido: {e}") from None
+    if not sizes or min(sizes) <= 0 or chunk_size <= 0:
+        raise ValueError("el tamaño debe ser mayor que 0")
+    if chunk_size > MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size no puede superar {format_size(MAX_CHUNK_SIZE)}")
+
+    name_template = data.get('name', DEFAULT_NAME_TEMPLATE)
+    names = {format_name(name_template, "archivo.bin", size, index) for index, size in enumerate(sizes)}
+    if len(names) < len(sizes):
+        raise ValueError("la plantilla de nombre debe distinguir cada tamaño, p. ej. con {size} o {index}")
+
+    output = data.get('output')
+    if output and not os.path.isdir(output):
+        raise ValueError(f"la carpeta de salida no existe: {output}")
+    fill = str(data.get('fill', "00"))
+    parse_fill(fill)
+
+    options = ExpansionOptions(sizes[0],
+                               mode=mode,
+                               output_folder=os.path.abspath(output) if output else None,
+                               use_prefix=bool(data.get('prefix', False)),
+                               strategy=choice(data.get('strategy', "escribir"), CLI_STRATEGIES,
+                                               PADDING_STRATEGIES, "estrategia"),
+                               chunk_size=chunk_size,
+                               durability=choice(data.get('durability', "ninguna"), CLI_DURABILITY,
+                                                 DURABILITY, "durabilidad"),
+                               skip_existing=bool(data.get('skip_existing', True)),
+                               padding_check=choice(data.get('padding', "ignorar"), CLI_PADDING_CHECKS,
+                                                    PADDING_CHECKS, "control de relleno"),
+                               targets=sizes,
+                               name_template=name_template,
+                               fill=fill,
+                               undo=bool(data.get('undo', True)),
+                               drop_cache=bool(data.get('drop_cache', False)))
+    return options, [os.path.abspath(path) for path in paths]
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """Atiende la API HTTP/JSON; el JobScheduler está en `self.server.scheduler`."""
+
+    server_version = "KizServer/1.0"
+
+    def do_GET(self):
+        scheduler = self.server.scheduler
+        parts = self.path_parts()
+        if parts == ["jobs"]:
+            return self.send_json(200, {'jobs': [job.status() for job in scheduler.list()]})
+        if parts == ["limits"]:
+            return self.send_json(200, self.limits_status())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = scheduler.get(parts[1])
+            if job is None:
+                return self.send_json(404, {'error': f"no existe el trabajo {parts[1]}"})
+            if len(parts) == 2:
+                return self.send_json(200, job.status())
+            if parts[2] == "report":
+                return self.send_json(200, job.report.to_dict())
+        self.send_json(404, {'error': "ruta desconocida"})
+
+    def do_POST(self):
+        if self.rejected():
+            return
+        parts = self.path_parts()
+        if parts == ["jobs"]:
+            return self.submit_job()
+        if parts == ["limits"]:
+            return self.set_limits()
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            return self.cancel_job(parts[1])
+        self.send_json(404, {'error': "ruta desconocida"})
+
+    def do_DELETE(self):
+        if self.rejected():
+            return
+        parts = self.path_parts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            return self.cancel_job(parts[1])
+        self.send_json(404, {'error': "ruta desconocida"})
+
+    def submit_job(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length).decode('utf-8') or "{}")
+            options, paths = options_from_request(data)
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+
+        registry = collect_files(paths)
+        file_paths = list(registry)
+        if not file_paths:
+            return self.send_json(400, {'error': "no hay archivos para procesar"})
+
+        # Comprobar el espacio antes de aceptar el trabajo, igual que la línea de comandos
+        try:
+            plan = plan_batch(options, registry.entries())
+        except OSError as e:
+            return self.send_json(500, {'error': f"no se pudo comprobar el espacio libre: {e}"})
+        if not plan.ok and not data.get('force'):
+            return self.send_json(507, {'error': "espacio libre insuficiente", 'plan': plan.lines()})
+
+        # Con carpeta de salida el trabajo usa el disco de esa carpeta (Expander.device_of)
+        device_of = None
+        if not options.output_folder:
+            device_of = lambda file_path: registry.get(file_path).dev
+        try:
+            job = self.server.scheduler.submit(options, file_paths, device_of)
+        except OSError as e:
+            return self.send_json(500, {'error': f"no se pudo crear el trabajo: {e}"})
+        self.send_json(201, job.status())
+
+    def set_limits(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length).decode('utf-8') or "{}")
+            if not isinstance(data, dict):
+                raise ValueError("el cuerpo debe ser un objeto JSON")
+            bytes_per_second = data.get('bytes_per_second')
+            if bytes_per_second is not None:
+                bytes_per_second = parse_size(bytes_per_second)
+            files_per_second = data.get('files_per_second')
+            if files_per_second is not None:
+                files_per_second = float(files_per_second)
+            if min(bytes_per_second or 0, files_per_second or 0) < 0:
+                raise ValueError("los límites no pueden ser negativos")
+        except (TypeError, ValueError) as e:
+            return self.send_json(400, {'error': f"límite inválido: {e}"})
+        self.server.scheduler.limits.set(bytes_per_second, files_per_second)
+        self.send_json(200, self.limits_status())
+
+    def limits_status(self):
+        limits = self.server.scheduler.limits
+        return {'bytes_per_second': limits.bytes.rate, 'files_per_second': limits.files.rate}
+
+    def cancel_job(self, job_id):
+        job = self.server.scheduler.cancel(job_id)
+        if job is None:
+            return self.send_json(404, {'error': f"no existe el trabajo {job_id}"})
+        self.send_json(200, job.status())
+
+    def rejected(self):
+        """Rechaza las peticiones que modifican algo si no vienen de una herramienta local.
+
+        Un navegador puede enviar un POST a 127.0.0.1 desde cualquier página, pero
+        entonces lleva Origin, no puede poner un Content-Type JSON sin una consulta
+        previa que este servidor no atiende, y con DNS rebinding llega con un Host
+        ajeno. Devuelve True si ya respondió con el error.
+        """
+        port = self.server.server_port
+        if self.headers.get('Host') not in (f"127.0.0.1:{port}", f"localhost:{port}"):
+            self.send_json(403, {'error': "cabecera Host no permitida"})
+            return True
+        if self.headers.get('Origin') is not None:
+            self.send_json(403, {'error': "no se aceptan peticiones con cabecera Origin"})
+            return True
+        content_type = (self.headers.get('Content-Type') or "").split(";", 1)[0].strip().lower()
+        if content_type != "application/json":
+            self.send_json(415, {'error': "el Content-Type debe ser application/json"})
+            return True
+        return False
+
+    def path_parts(self):
+        """Partes de la ruta sin la consulta: "/jobs/3/report" -> ["jobs", "3", "report"]."""
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv=None):
+    """Punto de entrada; sirve hasta Ctrl+C."""
+    parser = argparse.ArgumentParser(prog="kiz_server",
+                                     description="Servidor local de trabajos de expansión con API HTTP/JSON.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"puerto en 127.0.0.1 (por defecto: {DEFAULT_PORT})")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="hilos compartidos por todos los trabajos (por defecto: 4)")
+    parser.add_argument("--per-device", type=int, default=2,
+                        help="hilos máximos por disco entre todos los trabajos (por defecto: 2)")
+    parser.add_argument("--keep", type=int, default=100,
+                        help="trabajos terminados que se conservan para consultarlos (por defecto: 100)")
+    parser.add_argument("--limit-rate", default="0", metavar="TAMAÑO",
+                        help="bytes escritos por segundo entre todos los trabajos, p. ej. 50MB; se puede "
+                             "cambiar con POST /limits (por defecto: sin límite)")
+    parser.add_argument("--limit-files", type=float, default=0, metavar="N",
+                        help="archivos abiertos por segundo entre todos los trabajos (por defecto: sin límite)")
+    parser.add_argument("--priority", choices=CLI_PRIORITIES, default="normal",
+                        help="prioridad de CPU y disco del servidor (por defecto: normal)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="mostrar cada petición")
+    args = parser.parse_args(argv)
+    try:
+        limit_rate = parse_size(args.limit_rate)
+    except ValueError as e:
+        parser.error(f"tamaño inválido: {e}")
+
+    # Antes de crear los hilos, que heredan la prioridad
+    for applied in set_priority(CLI_PRIORITIES[args.priority]):
+        print(f"Prioridad: {applied}")
+    scheduler = JobScheduler(args.workers, args.per_device, args.keep, RateLimits(limit_rate, args.limit_files))
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), JobRequestHandler)
+    except OSError as e:
+        print(f"No se pudo abrir el puerto {args.port}: {e}", file=sys.stderr)
+        scheduler.close()
+        return 1
+    server.daemon_threads = True
+    server.scheduler = scheduler
+    server.verbose = args.verbose
+
+    print(f"Servidor de trabajos en http://127.0.0.1:{server.server_port} "
+          f"({scheduler.workers} hilos, {scheduler.per_device} por disco)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Deteniendo: se cancelan los trabajos en curso...", file=sys.stderr)
+    finally:
+        server.server_close()
+        scheduler.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())